@@ -0,0 +1,355 @@
+"""
+This file is for micro-benchmarks of the game primitives and of the players' hot paths
+
+Every benchmark runs on a fixed corpus of positions, played out from the empty board with random moves from a
+fixed seed, so two runs time exactly the same work:
+    connect4.*  make_move, undo_move, get_winner, evaluate, copy and available_moves of Connect4
+    ttt.*       make_move, undo_move, winner and copy of TicTacToe
+    *.get_move.<player>    the latency of one move of each computer player
+    *.update_q_values      Q-learning updates per second, on the state histories of fixed random games
+A benchmark is first run WARMUP times, then timed `repeat` times; each sample repeats the benchmark until it
+lasts at least MIN_SAMPLE_TIME, the samples of all benchmarks are taken in turns, and the garbage collector
+is off while timing. The result of a benchmark is the median time per operation with its interquartile range
+(IQR): unlike the mean and the standard deviation, they are not skewed by the odd sample slowed down by the
+rest of the machine.
+
+A baseline is the JSON of a run. Compared with a baseline, a benchmark has regressed if its median is more than
+`threshold` slower and its IQR does not overlap the baseline's, so noise alone is not reported.
+
+Run `python benchmark.py [-k text] [--repeat n] [--save baseline.json] [--compare baseline.json]` from the
+project root; it exits with status 1 if a benchmark has regressed.
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+from connect4.game import Connect4
+from tictactoe.game import TicTacToe
+
+SEED = 1234
+POSITIONS = 64  # positions of the primitive benchmarks' corpora
+AGENT_POSITIONS = 8  # positions of the get_move benchmarks
+EPISODES = 32  # games of the update_q_values benchmarks
+WARMUP = 2
+REPEAT = 15
+MIN_SAMPLE_TIME = 0.02  # seconds
+THRESHOLD = 0.10
+BASELINE_PATH = "./benchmark_baseline.json"
+
+
+def random_positions(game_class, count, min_ply, max_ply, seed=SEED):
+    """
+    Unfinished positions reached by random moves
+    :return: a list of (game, letter to move)
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = game_class()
+        letter = 'X'
+        for _ in range(rng.randint(min_ply, max_ply)):
+            game.make_move(rng.choice(game.available_moves()), letter)
+            letter = 'O' if letter == 'X' else 'X'
+            if game.game_over():
+                break
+        if not game.game_over():
+            positions.append((game, letter))
+    return positions
+
+
+def _positions_with_moves(positions, seed=SEED):
+    """The positions with one legal move each"""
+    rng = random.Random(seed)
+    return [(game, letter, rng.choice(game.available_moves())) for game, letter in positions]
+
+
+def _timed_loop(positions, operation):
+    """A benchmark that times `operation(game, letter, move)` once per position"""
+    def run(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            for game, letter, move in positions:
+                operation(game, letter, move)
+        return time.perf_counter() - start
+    return run
+
+
+def _make_move_benchmark(positions):
+    """make_move alone: the moves are taken back after each pass, outside the timing"""
+    def run(number):
+        elapsed = 0.0
+        for _ in range(number):
+            start = time.perf_counter()
+            for game, letter, move in positions:
+                game.make_move(move, letter)
+            elapsed += time.perf_counter() - start
+            for game, letter, move in positions:
+                game.undo_move(move)
+        return elapsed
+    return run
+
+
+def _undo_move_benchmark(positions):
+    """undo_move alone: the moves are made before each pass, outside the timing"""
+    def run(number):
+        elapsed = 0.0
+        for _ in range(number):
+            for game, letter, move in positions:
+                game.make_move(move, letter)
+            start = time.perf_counter()
+            for game, letter, move in positions:
+                game.undo_move(move)
+            elapsed += time.perf_counter() - start
+        return elapsed
+    return run
+
+
+def _get_move_benchmark(positions, new_player):
+    """
+    One move per position; the player is made anew for every pass, outside the timing, so that tables kept
+    between moves do not carry over from one pass to the next
+    """
+    def run(number):
+        elapsed = 0.0
+        for _ in range(number):
+            random.seed(SEED)
+            player = new_player()
+            for game, letter in positions:
+                player.letter = letter
+                start = time.perf_counter()
+                player.get_move(game)
+                elapsed += time.perf_counter() - start
+        return elapsed
+    return run
+
+
+def _episodes(game_class, player_class, count, seed=SEED):
+    """The Q-table keys two Q-learning players go through in `count` random games, one list per player"""
+    random.seed(seed)
+    histories = []
+    for _ in range(count):
+        game = game_class()
+        players = {'X': player_class('X', training_mode=True, epsilon=1.0, epsilon_decay=1.0),
+                   'O': player_class('O', training_mode=True, epsilon=1.0, epsilon_decay=1.0)}
+        letter = 'X'
+        while not game.game_over():
+            game.make_move(players[letter].get_move(game), letter)
+            letter = 'O' if letter == 'X' else 'X'
+        histories.extend((player.letter, player.state_history) for player in players.values())
+    return histories
+
+
+def _update_q_values_benchmark(player_class, histories):
+    """Q-value updates of every history, with a new table for every pass"""
+    def run(number):
+        elapsed = 0.0
+        for _ in range(number):
+            q_table = {}
+            players = {letter: player_class(letter, q_table, training_mode=True) for letter in 'XO'}
+            for letter, history in histories:
+                player = players[letter]
+                player.state_history = list(history)
+                start = time.perf_counter()
+                player.update_q_values(1)
+                elapsed += time.perf_counter() - start
+        return elapsed
+    return run
+
+
+def connect4_benchmarks():
+    """:return: {name: (benchmark, operations per pass)}; a benchmark takes a number of passes, returns seconds"""
+    from connect4.player import MCTSPlayer, MiniMaxPlayer, QLearningPlayer, RandomComputerPlayer, \
+        SmartRandomComputerPlayer
+    positions = random_positions(Connect4, POSITIONS, 0, 30)
+    with_moves = _positions_with_moves(positions)
+    agent_positions = random_positions(Connect4, AGENT_POSITIONS, 4, 16)
+    histories = _episodes(Connect4, QLearningPlayer, EPISODES)
+    agents = {
+        'Random': lambda: RandomComputerPlayer(''),
+        'SmartRandom': lambda: SmartRandomComputerPlayer(''),
+        # without the book or the endgame solver, which would skip the search
+        'MiniMax': lambda: MiniMaxPlayer('', depth=4, tt_size=1 << 16, solve_below=None, book_path=None),
+        'MCTS': lambda: MCTSPlayer('', iterations=200, seed=SEED),
+        'Q-learning': lambda: QLearningPlayer(''),
+    }
+    benchmarks = {
+        'connect4.make_move': (_make_move_benchmark(with_moves), len(with_moves)),
+        'connect4.undo_move': (_undo_move_benchmark(with_moves), len(with_moves)),
+        'connect4.get_winner': (_timed_loop(with_moves, lambda game, letter, move: game.get_winner()),
+                                len(with_moves)),
+        'connect4.evaluate': (_timed_loop(with_moves, lambda game, letter, move: game.evaluate(letter)),
+                              len(with_moves)),
+        'connect4.copy': (_timed_loop(with_moves, lambda game, letter, move: game.copy()), len(with_moves)),
+        'connect4.available_moves': (_timed_loop(with_moves, lambda game, letter, move: game.available_moves()),
+                                     len(with_moves)),
+    }
+    for name, new_player in agents.items():
+        benchmarks[f'connect4.get_move.{name}'] = (_get_move_benchmark(agent_positions, new_player),
+                                                   len(agent_positions))
+    benchmarks['connect4.update_q_values'] = (_update_q_values_benchmark(QLearningPlayer, histories),
+                                              sum(len(history) for _, history in histories))
+    return benchmarks
+
+
+def ttt_benchmarks():
+    """:return: {name: (benchmark, operations per pass)}, as connect4_benchmarks"""
+    from tictactoe.player import MCTSPlayer, MiniMaxPlayer, QLearningPlayer, RandomComputerPlayer, \
+        SmartRandomComputerPlayer
+    positions = random_positions(TicTacToe, POSITIONS, 0, 7)
+    with_moves = _positions_with_moves(positions)
+    agent_positions = random_positions(TicTacToe, AGENT_POSITIONS, 1, 4)
+    histories = _episodes(TicTacToe, QLearningPlayer, EPISODES)
+    agents = {
+        'Random': lambda: RandomComputerPlayer(''),
+        'SmartRandom': lambda: SmartRandomComputerPlayer(''),
+        # without the solved table, which would skip the search
+        'MiniMax': lambda: MiniMaxPlayer('', solved_table_path=None),
+        'MCTS': lambda: MCTSPlayer('', iterations=200, seed=SEED),
+        'Q-learning': lambda: QLearningPlayer(''),
+    }
+    benchmarks = {
+        'ttt.make_move': (_make_move_benchmark(with_moves), len(with_moves)),
+        'ttt.undo_move': (_undo_move_benchmark(with_moves), len(with_moves)),
+        'ttt.winner': (_timed_loop(with_moves, lambda game, letter, move: game.winner(move, letter)),
+                       len(with_moves)),
+        'ttt.copy': (_timed_loop(with_moves, lambda game, letter, move: game.copy()), len(with_moves)),
+    }
+    for name, new_player in agents.items():
+        benchmarks[f'ttt.get_move.{name}'] = (_get_move_benchmark(agent_positions, new_player),
+                                              len(agent_positions))
+    benchmarks['ttt.update_q_values'] = (_update_q_values_benchmark(QLearningPlayer, histories),
+                                         sum(len(history) for _, history in histories))
+    return benchmarks
+
+
+def _summary(samples, number):
+    if len(samples) == 1:
+        # no spread to measure
+        q1 = median = q3 = samples[0]
+    else:
+        q1, median, q3 = statistics.quantiles(samples, n=4, method='inclusive')
+    return {'median': median, 'q1': q1, 'q3': q3, 'iqr': q3 - q1, 'min': min(samples), 'max': max(samples),
+            'ops_per_second': 1 / median, 'samples': len(samples), 'passes_per_sample': number}
+
+
+def measure(benchmarks, repeat=REPEAT, warmup=WARMUP):
+    """
+    Time benchmarks in rounds, one sample of each per round, so that a slow spell of the machine spreads over
+    all of them instead of skewing the few that were running at the time
+    :param benchmarks: {name: (benchmark, operations per pass)}; a benchmark is a function of a number of
+                       passes that returns the seconds they took
+    :return: {name: the statistics of the seconds per operation}
+    """
+    if repeat < 1:
+        raise ValueError("A benchmark needs at least one timed sample")
+    numbers = {}
+    for name, (benchmark, _) in benchmarks.items():
+        for _ in range(warmup):
+            benchmark(1)
+        # as many passes per sample as make it last MIN_SAMPLE_TIME
+        number = 1
+        while benchmark(number) < MIN_SAMPLE_TIME:
+            number *= 2
+        numbers[name] = number
+    samples = {name: [] for name in benchmarks}
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for name, (benchmark, operations) in benchmarks.items():
+                samples[name].append(benchmark(numbers[name]) / (numbers[name] * operations))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {name: _summary(samples[name], numbers[name]) for name in benchmarks}
+
+
+def run_benchmarks(pattern=None, repeat=REPEAT, warmup=WARMUP):
+    """
+    :param pattern: only run the benchmarks whose name contains it
+    :return: the results of the run, with the machine it ran on
+    """
+    benchmarks = {**connect4_benchmarks(), **ttt_benchmarks()}
+    if pattern:
+        benchmarks = {name: benchmark for name, benchmark in benchmarks.items() if pattern in name}
+    results = measure(benchmarks, repeat, warmup)
+    for name, result in results.items():
+        print_result(name, result)
+    return {'python': sys.version.split()[0], 'implementation': platform.python_implementation(),
+            'machine': platform.machine(), 'seed': SEED, 'results': results}
+
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.3g} {unit}'
+    return f'{seconds / 1e-9:.3g} ns'
+
+
+def print_result(name, result):
+    spread = result['iqr'] / result['median'] * 100
+    print(f"{name:36} {_format_time(result['median']):>10} +- {spread:4.1f}% IQR "
+          f"{result['ops_per_second']:14,.0f} ops/s")
+
+
+def compare(run, baseline, threshold=THRESHOLD):
+    """
+    :return: {name: 'regressed', 'improved' or 'unchanged'} for the benchmarks of both runs
+    """
+    verdicts = {}
+    for name, result in run['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median'] / base['median']
+        # the middle halves of the samples must be apart for a change to be more than noise
+        if ratio > 1 + threshold and result['q1'] > base['q3']:
+            verdict = 'regressed'
+        elif ratio < 1 - threshold and result['q3'] < base['q1']:
+            verdict = 'improved'
+        else:
+            verdict = 'unchanged'
+        verdicts[name] = verdict
+        print(f"{name:36} {_format_time(base['median']):>10} -> {_format_time(result['median']):>10} "
+              f"{ratio:6.2f}x {verdict}")
+    return verdicts
+
+
+def save_run(run, filename=BASELINE_PATH):
+    with open(filename, 'w') as f:
+        json.dump(run, f, indent=2)
+
+
+def load_run(filename=BASELINE_PATH):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the games and the players")
+    parser.add_argument('-k', dest='pattern', help="only run the benchmarks whose name contains this")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="timed samples per benchmark")
+    parser.add_argument('--save', metavar='FILE', help="save the run as a baseline")
+    parser.add_argument('--compare', metavar='FILE', help="compare the run with a baseline")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="slowdown of the median that counts as a regression")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    run = run_benchmarks(args.pattern, args.repeat)
+    if args.save:
+        save_run(run, args.save)
+    if args.compare:
+        print()
+        verdicts = compare(run, load_run(args.compare), args.threshold)
+        if 'regressed' in verdicts.values():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+This file is for checkpointing Q-learning training runs, so that they can be resumed after a crash
+A DirtyQTable Class
+A Checkpointer Class
+
+A checkpoint directory holds:
+    log-<g>.bin     append-only log; every checkpoint appends one record with the entries written since the
+                    previous checkpoint and the training state (episode, alpha and epsilon of both players,
+                    state of `random`)
+    base-<g>.bin    the whole Q-table as of the end of log-<g-1>, in the binary format of qtable.py
+    base-<g>.json   the training state as of the end of log-<g-1>
+A checkpoint only writes what changed, so it is cheap however big the table is. Every `compact_every`
+checkpoints the log is rotated and a background thread builds the next base from the previous base and the
+logs since, read back from disk the way a run is restored, then deletes the files the base replaces; the
+training thread does not copy the table. A run is restored from the newest base and the logs that follow it; a
+record cut short by a crash is dropped, and so are the .tmp files of a base that was being written.
+
+Record layout (little-endian): magic b'QLOG', state length (uint32), entry count (uint32), the state as JSON,
+the keys (uint64, qtable.pack_key) and the values (float64).
+"""
+import json
+import os
+import random
+import re
+import struct
+import sys
+import threading
+from array import array
+
+from qtable import load_binary_q_table, pack_key, save_binary_q_table, unpack_key
+
+RECORD_MAGIC = b'QLOG'
+RECORD_HEADER = struct.Struct('<4sII')
+FILE_PATTERN = re.compile(r'(log|base)-(\d+)\.(bin|json)(\.tmp)?$')
+
+
+class DirtyQTable(dict):
+    """A Q-table dict that remembers the keys written since the last checkpoint"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+
+def _training_state(episode, players):
+    return {'episode': episode,
+            'players': [{'alpha': player.alpha, 'epsilon': player.epsilon} for player in players],
+            'random': random.getstate()}
+
+
+def _set_training_state(state, players):
+    for player, player_state in zip(players, state['players']):
+        player.alpha = player_state['alpha']
+        player.epsilon = player_state['epsilon']
+    version, internal_state, gauss_next = state['random']
+    random.setstate((version, tuple(internal_state), gauss_next))
+
+
+def _pack_record(state, q_table, keys):
+    packed_keys = array('Q', [pack_key(*key) for key in keys])
+    values = array('d', [q_table[key] for key in keys])
+    if sys.byteorder == 'big':
+        packed_keys.byteswap()
+        values.byteswap()
+    state = json.dumps(state).encode()
+    return RECORD_HEADER.pack(RECORD_MAGIC, len(state), len(keys)) + state + packed_keys.tobytes() + \
+        values.tobytes()
+
+
+def _replay_log(filename, q_table):
+    """
+    Apply the records of a log to the table, and cut off a record left incomplete by a crash
+    :return: the training state of the last record, or None if the log has none
+    """
+    state = None
+    with open(filename, 'r+b') as f:
+        data = f.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            magic, state_length, count = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + state_length + 16 * count
+            if magic != RECORD_MAGIC or end > len(data):
+                break
+            start = offset + RECORD_HEADER.size
+            record_state = json.loads(data[start:start + state_length])
+            start += state_length
+            keys = array('Q', data[start:start + 8 * count])
+            values = array('d', data[start + 8 * count:end])
+            if sys.byteorder == 'big':
+                keys.byteswap()
+                values.byteswap()
+            # dict.update does not mark the entries as dirty
+            dict.update(q_table, zip(map(unpack_key, keys), values))
+            state = record_state
+            offset = end
+        if offset < len(data):
+            f.truncate(offset)
+    return state
+
+
+class Checkpointer:
+    """
+    Incremental checkpoints of a DirtyQTable and the training state of the players sharing it
+    """
+
+    def __init__(self, directory, q_table, flags=0, compact_every=10):
+        """
+        :param q_table: the DirtyQTable of the players
+        :param flags: the qtable.FLAG_* bits of the bases
+        :param compact_every: number of checkpoints between two compactions
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.q_table = q_table
+        self.flags = flags
+        self.compact_every = compact_every
+        self._generation = 0
+        self._log = None
+        self._records = 0
+        self._compaction = None
+
+    def _path(self, kind, generation, extension='bin'):
+        return os.path.join(self.directory, f'{kind}-{generation}.{extension}')
+
+    def _generations(self, kind):
+        generations = []
+        for filename in os.listdir(self.directory):
+            match = FILE_PATTERN.match(filename)
+            if match and match.group(1) == kind and match.group(3) == 'bin' and not match.group(4):
+                generations.append(int(match.group(2)))
+        return sorted(generations)
+
+    def restore(self, players):
+        """
+        Load the latest checkpoint into the table and the players, and reseed `random` as it was
+        :param players: the players sharing the table, in the same order as for checkpoint()
+        :return: the number of episodes played before the checkpoint, 0 if there is none
+        """
+        self.q_table.clear()
+        first_log, logs, state = self._read(self.q_table)
+        self.q_table.dirty = set()
+        self._generation = logs[-1] if logs else first_log
+        self._remove_before(first_log)
+        if state is None:
+            return 0
+        _set_training_state(state, players)
+        return state['episode']
+
+    def _read(self, q_table, end=None):
+        """
+        Load the newest base and the logs that follow it into q_table
+        :param end: only read the logs of the generations before this one
+        :return: (generation of the base, 0 if there is none; generations of the logs read; the training state
+                  they end with, or None if there is none)
+        """
+        state = None
+        bases = self._generations('base')
+        first_log = 0
+        if bases:
+            first_log = bases[-1]
+            # the base is renamed into place last, so its state file is complete if the base exists
+            with open(self._path('base', first_log, 'json')) as f:
+                state = json.load(f)
+            dict.update(q_table, load_binary_q_table(self._path('base', first_log)))
+        logs = [generation for generation in self._generations('log')
+                if generation >= first_log and (end is None or generation < end)]
+        for generation in logs:
+            state = _replay_log(self._path('log', generation), q_table) or state
+        return first_log, logs, state
+
+    def checkpoint(self, episode, players):
+        """
+        Append the entries written since the last checkpoint and the training state to the log
+        :param episode: the number of episodes played so far
+        """
+        state = _training_state(episode, players)
+        table = self.q_table
+        keys = list(table.dirty)
+        table.dirty = set()
+        if self._log is None:
+            self._log = open(self._path('log', self._generation), 'ab')
+        self._log.write(_pack_record(state, table, keys))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._records += 1
+        if self._records >= self.compact_every and (self._compaction is None or not self._compaction.is_alive()):
+            self._compact(state)
+
+    def _compact(self, state):
+        # the next base is the table as of now, so the records written from here go to a new log
+        self._log.close()
+        self._log = None
+        self._records = 0
+        self._generation += 1
+        self._compaction = threading.Thread(target=self._write_base, args=(self._generation, state), daemon=True)
+        self._compaction.start()
+
+    def _write_base(self, generation, state):
+        # the previous base and the closed logs hold the table as of the rotation
+        snapshot = {}
+        self._read(snapshot, end=generation)
+        state_path = self._path('base', generation, 'json')
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(state_path + '.tmp', state_path)
+        # float64 values, so that a restored run goes on with exactly the values it had
+        save_binary_q_table(snapshot, self._path('base', generation), typecode='d', flags=self.flags)
+        self._remove_before(generation)
+
+    def _remove_before(self, generation):
+        """
+        Delete the bases and logs that the base of `generation` replaces, and the .tmp files of bases whose
+        writing was cut short; no base is being written when this is called
+        """
+        for filename in os.listdir(self.directory):
+            match = FILE_PATTERN.match(filename)
+            if match and (int(match.group(2)) < generation or match.group(4)):
+                os.remove(os.path.join(self.directory, filename))
+
+    def close(self):
+        """Wait for a running compaction and close the log"""
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
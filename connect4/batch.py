@@ -0,0 +1,130 @@
+"""
+This file is for scoring many Connect4 positions at once with NumPy
+
+Boards are (N, 6, 7) int8 arrays laid out like Connect4.board (row 0 is the top row), with CELL_VALUES
+for the cells: 0 for empty, 1 for 'X' and 2 for 'O'.
+The stones of each player are summed over the 69 four-cell windows with shifted slices (one add per cell of
+a window and direction), which gives winners and the heuristic of Connect4.evaluate for the whole batch
+without a Python loop over boards or cells.
+
+NumPy is only needed for this module.
+Run `python -m connect4.batch` from the project root to cross-check it against connect4/game.py.
+"""
+import numpy as np
+
+from .game import HEIGHT, WIDTH, WINDOW_SCORES, Connect4
+
+CELL_VALUES = {' ': 0, 'X': 1, 'O': 2}
+NO_WINNER = 0
+LETTERS = {0: None, 1: 'X', 2: 'O'}
+_WINDOW_SCORES = np.array(WINDOW_SCORES, dtype=np.int64)
+
+
+def game_to_array(game):
+    """The (6, 7) int8 array of a Connect4 game"""
+    return np.array([[CELL_VALUES[cell] for cell in row] for row in game.board], dtype=np.int8)
+
+
+def games_to_array(games):
+    """The (N, 6, 7) int8 array of a sequence of Connect4 games"""
+    boards = np.zeros((len(games), HEIGHT, WIDTH), dtype=np.int8)
+    for i, game in enumerate(games):
+        boards[i] = game_to_array(game)
+    return boards
+
+
+def window_counts(stones):
+    """
+    Count stones in every four-cell window
+    :param stones: (N, 6, 7) array, 1 where the player has a stone
+    :return: (N, 69) int8 array of stone counts, one column per window
+    """
+    horizontal = stones[:, :, 0:4] + stones[:, :, 1:5] + stones[:, :, 2:6] + stones[:, :, 3:7]
+    vertical = stones[:, 0:3, :] + stones[:, 1:4, :] + stones[:, 2:5, :] + stones[:, 3:6, :]
+    # going down-right and up-right in row-from-the-top order
+    diagonal = stones[:, 0:3, 0:4] + stones[:, 1:4, 1:5] + stones[:, 2:5, 2:6] + stones[:, 3:6, 3:7]
+    anti_diagonal = stones[:, 3:6, 0:4] + stones[:, 2:5, 1:5] + stones[:, 1:4, 2:6] + stones[:, 0:3, 3:7]
+    return np.concatenate([counts.reshape(len(stones), -1)
+                           for counts in (horizontal, vertical, diagonal, anti_diagonal)], axis=1)
+
+
+def _counts(boards):
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, HEIGHT, WIDTH)
+    return window_counts((boards == 1).view(np.int8)), window_counts((boards == 2).view(np.int8))
+
+
+def batch_winners(boards):
+    """
+    The winner of every board, like Connect4.get_winner ('X' is reported if both players have four)
+    :param boards: (N, 6, 7) int8 array
+    :return: (N,) int8 array of CELL_VALUES: 1 for 'X', 2 for 'O', NO_WINNER if nobody has four
+    """
+    x_counts, o_counts = _counts(boards)
+    x_wins = (x_counts == 4).any(axis=1)
+    o_wins = (o_counts == 4).any(axis=1)
+    return np.where(x_wins, 1, np.where(o_wins, 2, NO_WINNER)).astype(np.int8)
+
+
+def batch_evaluate(boards, player='X'):
+    """
+    The heuristic score of every board for `player`, equal to Connect4.evaluate
+    :param boards: (N, 6, 7) int8 array
+    :param player: 'X' or 'O'
+    :return: (N,) int64 array
+    """
+    x_counts, o_counts = _counts(boards)
+    x_scores = np.where(o_counts == 0, _WINDOW_SCORES[x_counts], 0).sum(axis=1)
+    o_scores = np.where(x_counts == 0, _WINDOW_SCORES[o_counts], 0).sum(axis=1)
+    return x_scores - o_scores if player == 'X' else o_scores - x_scores
+
+
+def child_boards(game, letter):
+    """
+    The boards after every available move of `letter`, to score all children of a node in one call
+    :return: (the list of moves, (len(moves), 6, 7) int8 array of the resulting boards)
+    """
+    board = game_to_array(game)
+    moves = game.available_moves()
+    children = np.repeat(board[np.newaxis], len(moves), axis=0)
+    for i, col in enumerate(moves):
+        children[i, HEIGHT - 1 - game.heights[col], col] = CELL_VALUES[letter]
+    return moves, children
+
+
+def _random_games(n, seed):
+    """n positions from random games of random length, for checking against the scalar implementation"""
+    rng = np.random.default_rng(seed)
+    games = []
+    for _ in range(n):
+        game = Connect4()
+        letter = 'X'
+        for _ in range(rng.integers(0, WIDTH * HEIGHT + 1)):
+            moves = game.available_moves()
+            if not moves:
+                break
+            game.make_move(moves[rng.integers(len(moves))], letter)
+            letter = 'O' if letter == 'X' else 'X'
+        games.append(game)
+    return games
+
+
+if __name__ == '__main__':
+    import time
+
+    games = _random_games(20000, seed=0)
+    boards = games_to_array(games)
+    start = time.perf_counter()
+    winners = batch_winners(boards)
+    x_scores = batch_evaluate(boards, 'X')
+    o_scores = batch_evaluate(boards, 'O')
+    elapsed = time.perf_counter() - start
+    for game, winner, x_score, o_score in zip(games, winners, x_scores, o_scores):
+        assert LETTERS[int(winner)] == game.get_winner(), game
+        assert x_score == game.evaluate('X') and o_score == game.evaluate('O'), game
+    moves, children = child_boards(games[0], 'X')
+    for col, child_score in zip(moves, batch_evaluate(children, 'X')):
+        child = games[0].copy()
+        child.make_move(col, 'X')
+        assert child_score == child.evaluate('X')
+    print(f"{len(games)} boards match connect4/game.py, scored in {elapsed * 1000:.1f}ms "
+          f"({len(games) / elapsed:,.0f} boards/s)")
@@ -0,0 +1,155 @@
+"""
+This file is for building and reading the Connect4 opening book
+A OpeningBook Class
+
+The book holds the best move and its score for every position of the first `plies` plies, found by a deep
+search.SearchEngine search of each position, spread over a process pool. A position and its mirror image
+share one entry, keyed by the smaller of their two board_to_key encodings (see game.canonical_state); the
+move is stored for that orientation and mirrored back on lookup.
+
+File layout (little-endian): magic b'C4OB', version (uint8), plies (uint8), depth (uint8), entry count
+(uint32), then the keys (uint64, ascending), the moves (int8) and the scores (int32). A lookup is a binary
+search of the keys.
+
+Run `python -m connect4.book [plies] [depth] [workers]` from the project root to build the book.
+"""
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from multiprocessing import Pool
+
+from consts import CONNECT4_BOOK_PATH
+from move_ordering import MoveOrderer
+from search import SearchEngine
+from .game import CENTER_FIRST_COLUMNS, Connect4, canonical_state
+
+MAGIC = b'C4OB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBI')
+BOOK_PLIES = 6
+BOOK_DEPTH = 10
+
+
+def book_positions(plies):
+    """
+    The positions of the first `plies` plies without a winner, one per mirror pair
+    :return: a list of (canonical key, game, letter to move)
+    """
+    positions = []
+    layer = {0: Connect4()}
+    for ply in range(plies):
+        letter = 'X' if ply % 2 == 0 else 'O'
+        next_layer = {}
+        for key, game in layer.items():
+            positions.append((key, game, letter))
+            for col in game.available_moves():
+                child = game.copy()
+                child.make_move(col, letter)
+                child_key = canonical_state(child.state_id)[0]
+                if child.current_winner is None and child_key not in next_layer:
+                    next_layer[child_key] = child
+        layer = next_layer
+    return positions
+
+
+# the search engine of a process of the book's pool
+_worker_engine = None
+
+
+def _init_book_worker():
+    global _worker_engine
+    _worker_engine = SearchEngine(move_orderer=MoveOrderer(CENTER_FIRST_COLUMNS))
+
+
+def _search_position(task):
+    """Search one position in a worker: (key, move in the key's orientation, score)"""
+    key, game, letter, depth = task
+    score, move = _worker_engine.search(game, letter, depth)
+    columns = canonical_state(game.state_id)[1]
+    return key, columns[move], score
+
+
+def build_book(plies=BOOK_PLIES, depth=BOOK_DEPTH, workers=None):
+    """
+    Search every position of the first `plies` plies to `depth` on a pool of `workers` processes
+    :return: an OpeningBook
+    """
+    tasks = [(key, game, letter, depth) for key, game, letter in book_positions(plies)]
+    with Pool(workers, initializer=_init_book_worker) as pool:
+        # the positions far from the end are the slowest, and some take much longer than others
+        results = sorted(pool.imap_unordered(_search_position, tasks, chunksize=1))
+    return OpeningBook(array('Q', [key for key, _, _ in results]), array('b', [move for _, move, _ in results]),
+                       array('i', [score for _, _, score in results]), plies, depth)
+
+
+class OpeningBook:
+    """
+    The best moves of the first plies of the game, looked up by position
+    """
+
+    def __init__(self, keys, moves, scores, plies, depth):
+        """
+        :param keys: canonical keys in ascending order
+        :param moves: the best move of each key, in the key's orientation
+        :param scores: the search score of each move for the player to move
+        """
+        self.keys = keys
+        self.moves = moves
+        self.scores = scores
+        self.plies = plies
+        self.depth = depth
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, game):
+        """
+        :return: (best move, score for the player to move), or None if the position is not in the book
+        """
+        key, columns = canonical_state(game.state_id)
+        index = bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        # a column and its mirror image map onto each other both ways
+        return columns[self.moves[index]], self.scores[index]
+
+    def save(self, filename=CONNECT4_BOOK_PATH):
+        keys, moves, scores = array('Q', self.keys), array('b', self.moves), array('i', self.scores)
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            scores.byteswap()
+        with open(filename, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.plies, self.depth, len(keys)))
+            keys.tofile(f)
+            moves.tofile(f)
+            scores.tofile(f)
+
+    @classmethod
+    def load(cls, filename=CONNECT4_BOOK_PATH):
+        """
+        :raise FileNotFoundError: if the book has not been built
+        """
+        with open(filename, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f"{filename} is not a Connect4 opening book")
+            magic, version, plies, depth, count = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{filename} is not a Connect4 opening book")
+            keys, moves, scores = array('Q'), array('b'), array('i')
+            keys.fromfile(f, count)
+            moves.fromfile(f, count)
+            scores.fromfile(f, count)
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            scores.byteswap()
+        return cls(keys, moves, scores, plies, depth)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    book = build_book(*args)
+    book.save()
+    print(f"Searched {len(book)} positions of the first {book.plies} plies to depth {book.depth}, "
+          f"saved to {CONNECT4_BOOK_PATH}")
@@ -1,62 +1,303 @@
+import random
+
+WIDTH = 7
+HEIGHT = 6
+# Each column takes HEIGHT + 1 bits: bit (col * COLUMN_BITS + row) is the cell at `row` counted from the bottom.
+# The extra (always empty) bit on top of every column stops the shifts below from wrapping between columns.
+COLUMN_BITS = HEIGHT + 1
+COLUMN_MASK = (1 << COLUMN_BITS) - 1
+# column maps for mirror symmetry
+IDENTITY_COLUMNS = tuple(range(WIDTH))
+MIRRORED_COLUMNS = tuple(WIDTH - 1 - col for col in range(WIDTH))
+FOLDED_COLUMNS = tuple(min(col, WIDTH - 1 - col) for col in range(WIDTH))
+# columns closer to the center take part in more lines of four, so they are usually the better moves
+CENTER_FIRST_COLUMNS = tuple(sorted(range(WIDTH), key=lambda col: abs(2 * col - (WIDTH - 1))))
+# vertical, horizontal, diagonal (/) and anti-diagonal (\) neighbours in the bit layout
+DIRECTIONS = (1, COLUMN_BITS, COLUMN_BITS + 1, COLUMN_BITS - 1)
+# the bottom cell of every column, and every cell of the board (without the extra bits on top)
+BOTTOM_CELLS = sum(1 << col * COLUMN_BITS for col in range(WIDTH))
+BOARD_CELLS = BOTTOM_CELLS * ((1 << HEIGHT) - 1)
+TOP_CELLS = BOTTOM_CELLS << HEIGHT - 1
+# the cells of every column, and the open columns of every 7-bit pattern of open columns, for playouts
+COLUMN_CELLS = tuple(COLUMN_MASK >> 1 << col * COLUMN_BITS for col in range(WIDTH))
+OPEN_COLUMNS = tuple(tuple(col for col in range(WIDTH) if pattern >> col & 1) for pattern in range(1 << WIDTH))
+
+# The 69 four-cell windows a line of four can occupy, as tuples of bit indices
+WINDOWS = tuple(
+    tuple((col + i * dc) * COLUMN_BITS + row + i * dr for i in range(4))
+    for dc, dr in ((0, 1), (1, 0), (1, 1), (1, -1))
+    for col in range(WIDTH) for row in range(HEIGHT)
+    if 0 <= col + 3 * dc < WIDTH and 0 <= row + 3 * dr < HEIGHT
+)
+# the windows that contain each bit index
+CELL_WINDOWS = tuple(tuple(w for w, window in enumerate(WINDOWS) if index in window)
+                     for index in range(WIDTH * COLUMN_BITS))
+# score of a window by number of stones of one player, if the other player has no stone in it
+WINDOW_SCORES = (0, 1, 10, 100, 1000)
+# The content of a window is coded as (X stones) + 5 * (O stones).
+# Adding or removing a stone changes the code by WINDOW_STEPS[letter]
+# and the board's score for X by ADD_DELTAS[letter][code] or REMOVE_DELTAS[letter][code].
+WINDOW_STEPS = {'X': 1, 'O': 5}
+
+
+def _window_value(code):
+    x_stones, o_stones = code % 5, code // 5
+    return (WINDOW_SCORES[x_stones] if o_stones == 0 else 0) - (WINDOW_SCORES[o_stones] if x_stones == 0 else 0)
+
+
+ADD_DELTAS = {letter: tuple(_window_value(code + step) - _window_value(code) if code + step < 25 else 0
+                            for code in range(25))
+              for letter, step in WINDOW_STEPS.items()}
+REMOVE_DELTAS = {letter: tuple(_window_value(code - step) - _window_value(code) if code >= step else 0
+                               for code in range(25))
+                 for letter, step in WINDOW_STEPS.items()}
+
+# Zobrist keys: one random 64-bit number per (letter, cell), seeded so that hashes are stable between runs
+_zobrist_random = random.Random(20240417)
+ZOBRIST_KEYS = {letter: [_zobrist_random.getrandbits(64) for _ in range(WIDTH * COLUMN_BITS)] for letter in 'XO'}
+
+
+def has_four(bitboard):
+    """
+    Check whether a bitboard contains four in a row with a constant number of shifts and masks
+    :param bitboard: the stones of one player
+    :return: True if the stones contain a four-in-a-row
+    """
+    for shift in DIRECTIONS:
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> 2 * shift):
+            return True
+    return False
+
+
+def winning_cells(bitboard):
+    """
+    The cells that would complete a four-in-a-row for the stones of `bitboard`, whether they are empty or not
+    """
+    cells = 0
+    for shift in DIRECTIONS:
+        # three stones in a row next to the cell, or two on one side and one on the other
+        pairs = (bitboard << shift) & (bitboard << 2 * shift)
+        cells |= pairs & (bitboard << 3 * shift)
+        cells |= pairs & (bitboard >> shift)
+        pairs = (bitboard >> shift) & (bitboard >> 2 * shift)
+        cells |= pairs & (bitboard << shift)
+        cells |= pairs & (bitboard >> 3 * shift)
+    return cells & BOARD_CELLS
+
+
+def board_to_key(board):
+    """
+    Encode a 6x7 grid (row 0 is the top) as a unique int below 2^49:
+    the bitboard of the 'X' stones plus the bitboard of all stones.
+    Within a column, all stones + 'X' stones stays below the next column's bits, so no information is lost.
+    """
+    x_board = all_stones = 0
+    for row_index, row in enumerate(board):
+        for col, cell in enumerate(row):
+            if cell != ' ':
+                bit = 1 << (col * COLUMN_BITS + HEIGHT - 1 - row_index)
+                all_stones |= bit
+                if cell == 'X':
+                    x_board |= bit
+    return x_board + all_stones
+
+
+def key_to_board(key):
+    """
+    Decode an int made by board_to_key back into a 6x7 grid
+    """
+    grid = [[' ' for _ in range(WIDTH)] for _ in range(HEIGHT)]
+    for col in range(WIDTH):
+        column = key >> (col * COLUMN_BITS) & COLUMN_MASK
+        # the stones of a column are 2^height - 1, and the 'X' stones are what is left over
+        height = (column + 1).bit_length() - 1
+        x_stones = column - ((1 << height) - 1)
+        for row in range(height):
+            grid[HEIGHT - 1 - row][col] = 'X' if x_stones >> row & 1 else 'O'
+    return grid
+
+
+def key_after_move(key, col, letter):
+    """
+    The board_to_key encoding of the position after dropping a stone of `letter` into `col`
+    :return: the new key, or None if the column is full
+    """
+    column = key >> (col * COLUMN_BITS) & COLUMN_MASK
+    height = (column + 1).bit_length() - 1
+    if height == HEIGHT:
+        return None
+    bit = 1 << (col * COLUMN_BITS + height)
+    # the stone is added to all stones, and to the 'X' stones as well if it is an 'X'
+    return key + (2 * bit if letter == 'X' else bit)
+
+
+def mirror_key(key):
+    """
+    The board_to_key encoding of the board mirrored across the center column
+    """
+    mirrored = 0
+    for col in range(WIDTH):
+        mirrored |= (key >> (col * COLUMN_BITS) & COLUMN_MASK) << ((WIDTH - 1 - col) * COLUMN_BITS)
+    return mirrored
+
+
+def canonical_state(key):
+    """
+    Pick one representative for a board and its mirror image
+    :return: (the smaller of the two keys, a tuple mapping each column to the matching column there)
+    """
+    mirrored = mirror_key(key)
+    if mirrored < key:
+        return mirrored, MIRRORED_COLUMNS
+    if mirrored == key:
+        # on a symmetric board a column and its mirror image are the same move
+        return key, FOLDED_COLUMNS
+    return key, IDENTITY_COLUMNS
+
+
 class Connect4:
+    """
+    Connect4 board backed by two bitboards (one per letter) and the height of every column.
+    zobrist_hash is the XOR of the Zobrist keys of all stones and is kept up to date on every move.
+    window_codes[w] is the content of WINDOWS[w] and window_score is the heuristic score of the board for 'X';
+    both are updated on every move for the windows through the new stone, so evaluate() is O(1).
+    """
+
     def __init__(self):
-        self.board = [[' ' for _ in range(7)] for _ in range(6)]
+        self.bitboards = {'X': 0, 'O': 0}
+        self.heights = [0] * WIDTH
+        self.zobrist_hash = 0
+        self.window_codes = [0] * len(WINDOWS)
+        self.window_score = 0
         self.turn = 'X'
         self.current_winner = None
 
     def reset(self):
-        self.board = [[' ' for _ in range(7)] for _ in range(6)]
+        self.bitboards = {'X': 0, 'O': 0}
+        self.heights = [0] * WIDTH
+        self.zobrist_hash = 0
+        self.window_codes = [0] * len(WINDOWS)
+        self.window_score = 0
         self.turn = 'X'
         self.current_winner = None
 
+    @property
+    def board(self):
+        """
+        The 6x7 grid of 'X', 'O' and ' ' (row 0 is the top row), rebuilt from the bitboards.
+        It is a read-only view: use make_move and undo_move to change the position.
+        """
+        x_board = self.bitboards['X']
+        o_board = self.bitboards['O']
+        grid = []
+        for row in range(HEIGHT - 1, -1, -1):
+            cells = []
+            for col in range(WIDTH):
+                bit = 1 << (col * COLUMN_BITS + row)
+                cells.append('X' if x_board & bit else 'O' if o_board & bit else ' ')
+            grid.append(cells)
+        return grid
+
+    @property
+    def state_id(self):
+        """The position encoded as an int, the same encoding as board_to_key"""
+        x_board = self.bitboards['X']
+        return x_board + (x_board | self.bitboards['O'])
+
+    @property
+    def position_hash(self):
+        """The hash of the position for the search engine (see search.py)"""
+        return self.zobrist_hash
+
     def make_move(self, col, turn):
-        if not 0 <= col < 7:
+        if not 0 <= col < WIDTH:
             return False
-        if self.board[0][col] != ' ':
+        row = self.heights[col]
+        if row == HEIGHT:
             return False
-        for row in range(5, -1, -1):
-            if self.board[row][col] == ' ':
-                self.board[row][col] = turn
-                self.current_winner = self.get_winner()
-                return [row, col]
-        return False
+        index = col * COLUMN_BITS + row
+        self.bitboards[turn] |= 1 << index
+        self.heights[col] = row + 1
+        self.zobrist_hash ^= ZOBRIST_KEYS[turn][index]
+        self._add_to_windows(turn, index)
+        # only the stone just dropped can complete a four, so only the mover's bitboard needs checking
+        if has_four(self.bitboards[turn]):
+            self.current_winner = turn
+        return [HEIGHT - 1 - row, col]
 
     def change_turn(self):
         self.turn = 'O' if self.turn == 'X' else 'X'
 
     def empty_squares(self):
-        return ' ' in [cell for row in self.board for cell in row]
+        return sum(self.heights) < WIDTH * HEIGHT
 
     def num_empty_squares(self):
-        return sum(row.count(' ') for row in self.board)
+        return WIDTH * HEIGHT - sum(self.heights)
 
     def available_moves(self):
         """
         Get the available moves for the current board
         :return:
         """
-        return [col for col in range(7) if self.board[0][col] == ' ']
+        return [col for col in range(WIDTH) if self.heights[col] < HEIGHT]
+
+    def winning_moves(self, letter):
+        """
+        The columns where a stone of `letter` would make four in a row right now
+        """
+        stones = self.bitboards['X'] | self.bitboards['O']
+        # adding the bottom cells carries each column up to its lowest empty cell
+        playable = (stones + BOTTOM_CELLS) & BOARD_CELLS
+        cells = winning_cells(self.bitboards[letter]) & playable
+        if not cells:
+            return []
+        return [col for col in range(WIDTH) if cells >> col * COLUMN_BITS & COLUMN_MASK]
+
+    def playout(self, letter, rng):
+        """
+        Play the game out from this position with `letter` to move, on copies of the bitboards, for MCTS:
+        every move wins on the spot if it can, blocks a win of the opponent on the spot if it must, and
+        goes into a random column otherwise. The game is not changed.
+        :param rng: a random.Random
+        :return: the winner, or None for a tie
+        """
+        if self.current_winner is not None:
+            return self.current_winner
+        mine = self.bitboards[letter]
+        theirs = self.bitboards['O' if letter == 'X' else 'X']
+        stones = mine | theirs
+        random_ = rng.random
+        open_columns = sum(1 << col for col in range(WIDTH) if self.heights[col] < HEIGHT)
+        # the opponent's stones do not change on our move, so their winning cells carry over to their turn
+        my_cells = winning_cells(mine)
+        plies = 0
+        while open_columns:
+            playable = (stones + BOTTOM_CELLS) & BOARD_CELLS
+            if my_cells & playable:
+                break
+            their_cells = winning_cells(theirs)
+            cell = their_cells & playable
+            if cell:
+                cell &= -cell
+            else:
+                columns = OPEN_COLUMNS[open_columns]
+                cell = playable & COLUMN_CELLS[columns[int(random_() * len(columns))]]
+            if cell & TOP_CELLS:
+                open_columns ^= 1 << (cell.bit_length() - 1) // COLUMN_BITS
+            stones |= cell
+            mine, theirs = theirs, mine | cell
+            my_cells = their_cells
+            plies += 1
+        else:
+            return None
+        # the player to move wins
+        return letter if plies % 2 == 0 else ('O' if letter == 'X' else 'X')
 
     def get_winner(self):
-        for row in range(6):
-            for col in range(7):
-                if self.board[row][col] == ' ':
-                    continue
-                for dr, dc in [(0, 1), (1, 0), (1, 1), (1, -1)]:
-                    for i in range(1, 4):
-                        r, c = row + i * dr, col + i * dc
-                        if not (0 <= r < 6 and 0 <= c < 7):
-                            break
-                        try:
-                            if self.board[r][c] != self.board[row][col]:
-                                break
-                        except Exception as e:
-                            print(self.board)
-                            print(r, c)
-                            print(row, col)
-                            raise e
-                    else:
-                        return self.board[row][col]
+        for letter, bitboard in self.bitboards.items():
+            if has_four(bitboard):
+                return letter
         return None
 
     def __str__(self):
@@ -64,53 +305,73 @@ class Connect4:
 
     def copy(self):
         new_board = Connect4()
-        new_board.board = [row.copy() for row in self.board]
+        new_board.bitboards = self.bitboards.copy()
+        new_board.heights = self.heights.copy()
+        new_board.zobrist_hash = self.zobrist_hash
+        new_board.window_codes = self.window_codes.copy()
+        new_board.window_score = self.window_score
         new_board.turn = self.turn
         new_board.current_winner = self.current_winner
         return new_board
 
     def undo_move(self, col):
-        for row in range(6):
-            if self.board[row][col] != ' ':
-                self.board[row][col] = ' '
-                return True
-        return False
+        if not 0 <= col < WIDTH or self.heights[col] == 0:
+            return False
+        row = self.heights[col] - 1
+        index = col * COLUMN_BITS + row
+        bit = 1 << index
+        for letter, bitboard in self.bitboards.items():
+            if bitboard & bit:
+                self.bitboards[letter] = bitboard ^ bit
+                self.zobrist_hash ^= ZOBRIST_KEYS[letter][index]
+                self._remove_from_windows(letter, index)
+        self.heights[col] = row
+        # taking a stone back cannot make a four, so only a finished game can change its winner
+        if self.current_winner is not None:
+            self.current_winner = self.get_winner()
+        return True
+
+    def _add_to_windows(self, letter, index):
+        codes = self.window_codes
+        deltas = ADD_DELTAS[letter]
+        step = WINDOW_STEPS[letter]
+        score = self.window_score
+        for w in CELL_WINDOWS[index]:
+            code = codes[w]
+            score += deltas[code]
+            codes[w] = code + step
+        self.window_score = score
+
+    def _remove_from_windows(self, letter, index):
+        codes = self.window_codes
+        deltas = REMOVE_DELTAS[letter]
+        step = WINDOW_STEPS[letter]
+        score = self.window_score
+        for w in CELL_WINDOWS[index]:
+            code = codes[w]
+            score += deltas[code]
+            codes[w] = code - step
+        self.window_score = score
 
     def evaluate(self, player):
-        """Evaluate the board for a specific player to assign a heuristic score."""
-        score = 0
-        opponent = 'O' if player == 'X' else 'X'
-        sequences = {'2': 10, '3': 100, '4': 1000}
-
-        def count_sequences(player, sequence_length):
-            count = 0
-            for row in self.board:
-                # Count horizontal sequences
-                for col in range(7 - sequence_length + 1):
-                    if all(cell == player for cell in row[col:col + sequence_length]):
-                        count += 1
-            # Count vertical sequences
-            for col in range(7):
-                for row in range(6 - sequence_length + 1):
-                    if all(self.board[r][col] == player for r in range(row, row + sequence_length)):
-                        count += 1
-            # Count diagonal sequences
-            for row in range(6 - sequence_length + 1):
-                for col in range(7 - sequence_length + 1):
-                    if all(self.board[row + i][col + i] == player for i in range(sequence_length)):
-                        count += 1
-                    if col >= sequence_length - 1:
-                        if all(self.board[row + i][col - i] == player for i in range(sequence_length)):
-                            count += 1
-            return count
-
-        # Sum up the sequence scores for the player
-        for seq, seq_score in sequences.items():
-            length = int(seq)
-            score += count_sequences(player, length) * seq_score
-            score -= count_sequences(opponent, length) * seq_score
-
-        return score
+        """
+        Evaluate the board for a specific player to assign a heuristic score.
+        Every four-cell window that only holds stones of one player is a threat worth WINDOW_SCORES[stones]
+        to that player.
+        """
+        return self.window_score if player == 'X' else -self.window_score
+
+    def evaluate_after_move(self, col, letter, player):
+        """
+        evaluate(player) of the position after dropping a stone of `letter` into `col`, without playing it.
+        The column must not be full.
+        """
+        codes = self.window_codes
+        deltas = ADD_DELTAS[letter]
+        score = self.window_score
+        for w in CELL_WINDOWS[col * COLUMN_BITS + self.heights[col]]:
+            score += deltas[codes[w]]
+        return score if player == 'X' else -score
 
     def game_over(self):
         return self.current_winner is not None or not self.empty_squares()
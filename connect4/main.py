@@ -2,25 +2,43 @@
 This file is for the main game logic of Connect4
 """
 import time
+from functools import partial
 
+from checkpoint import Checkpointer, DirtyQTable
+from parallel_training import train_parallel
+from qtable import FLAG_CANONICAL
+from search_stats import SearchStats
+from tournament import run_tournament, print_results, save_results
 from .game import Connect4
 from .player import HumanPlayer, RandomComputerPlayer, SmartRandomComputerPlayer, MiniMaxPlayer, QLearningPlayer
 
-Q_TABLE_PATH = "./connect4/q_table.txt"
+Q_TABLE_PATH = "./connect4/q_table.bin"
 
 # Record results
 timer = {}  # response time
 moves = {}  # move count
 results = {}  # winning rate
+search_stats = {}  # total search_stats.SearchStats of the players that collect them
 
 
 def init_record(x, o):
-    global timer, moves, results
+    global timer, moves, results, search_stats
     x_name = x.__class__.__name__
     o_name = o.__class__.__name__
     timer = {x_name: 0, o_name: 0}
     moves = {x_name: 0, o_name: 0}
     results = {x_name: 0, o_name: 0, 'tie': 0}
+    search_stats = {}
+
+
+def record_stats(name, player):
+    """Add the search statistics of the player's last move to its total, if it collects them"""
+    stats = getattr(player, 'last_stats', None)
+    if stats is not None:
+        if name in search_stats:
+            search_stats[name].merge(stats)
+        else:
+            search_stats[name] = SearchStats.total([stats])
 
 
 def play(game, x_player, o_player, print_game=True):
@@ -34,9 +52,11 @@ def play(game, x_player, o_player, print_game=True):
         if game.turn == 'O':
             col = o_player.get_move(game)
             name = o_player.__class__.__name__
+            record_stats(name, o_player)
         else:
             name = x_player.__class__.__name__
             col = x_player.get_move(game)
+            record_stats(name, x_player)
         e = time.time()
 
         if game.make_move(col, game.turn):
@@ -65,40 +85,53 @@ def play(game, x_player, o_player, print_game=True):
     return 'tie'
 
 
-def train_q_learning_player(q_player, opponent, game, num_episodes=1000):
-    for episode in range(num_episodes):
-        # Reset the game at the start of each new game episode
-        game.reset()
-
-        # This is for training against a random player
-        # Randomly choose who goes first
-        # if random.randint(0, 1) == 0:
-        #     q_player.letter = 'X'
-        #     opponent.letter = 'O'
-        #     current_player = q_player
-        # else:
-        #     q_player.letter = 'O'
-        #     opponent.letter = 'X'
-        #     current_player = opponent
-
-        # This is for training against itself
-        current_player = q_player
-        while not game.game_over():
-            move = current_player.get_move(game)
-            game.make_move(move, current_player.letter)
-
-            # Switch turns
-            if current_player == q_player:
-                current_player = opponent
-            else:
-                current_player = q_player
-
-        if game.current_winner == q_player.letter:
-            reward = 1
-        elif game.current_winner is None:
-            reward = 0.1
+def play_training_episode(q_player, opponent, game):
+    """
+    Play one training game without updating the Q-values
+    :return: the reward of q_player
+    """
+    # Reset the game at the start of each new game episode
+    game.reset()
+
+    # This is for training against a random player
+    # Randomly choose who goes first
+    # if random.randint(0, 1) == 0:
+    #     q_player.letter = 'X'
+    #     opponent.letter = 'O'
+    #     current_player = q_player
+    # else:
+    #     q_player.letter = 'O'
+    #     opponent.letter = 'X'
+    #     current_player = opponent
+
+    # This is for training against itself
+    current_player = q_player
+    while not game.game_over():
+        move = current_player.get_move(game)
+        game.make_move(move, current_player.letter)
+
+        # Switch turns
+        if current_player == q_player:
+            current_player = opponent
         else:
-            reward = -1
+            current_player = q_player
+
+    if game.current_winner == q_player.letter:
+        return 1
+    elif game.current_winner is None:
+        return 0.1
+    else:
+        return -1
+
+
+def train_q_learning_player(q_player, opponent, game, num_episodes=1000, checkpointer=None, checkpoint_every=1000,
+                            start_episode=0):
+    """
+    :param checkpointer: a checkpoint.Checkpointer to save the progress to every checkpoint_every episodes
+    :param start_episode: the number of episodes already played, when resuming from a checkpoint
+    """
+    for episode in range(start_episode, num_episodes):
+        reward = play_training_episode(q_player, opponent, game)
 
         q_player.update_q_values(reward)
         # training against itself
@@ -107,98 +140,82 @@ def train_q_learning_player(q_player, opponent, game, num_episodes=1000):
         if (episode + 1) % 100 == 0:
             print(f"Episode {episode + 1}: Q-Player learns with reward {reward}")
             print("delta:", q_player.delta)
+        if checkpointer is not None and (episode + 1) % checkpoint_every == 0:
+            checkpointer.checkpoint(episode + 1, (q_player, opponent))
     # Save the Q-table
     q_player.save_q_table(Q_TABLE_PATH)
     print("alpha:", q_player.alpha)
     print("epsilon:", q_player.epsilon)
 
 
-def train(num_episodes=100000):
-    q_table = {}
+def train(num_episodes=100000, workers=1, sync_every=1000, seed=0, checkpoint_dir=None, checkpoint_every=1000):
+    """
+    Train two Q-learning players against each other
+    With workers > 1, the episodes are played on a process pool (see parallel_training.py)
+    With checkpoint_dir, the progress is saved there every checkpoint_every episodes (every round of
+    sync_every episodes with workers), and a run that was stopped goes on from its last checkpoint
+    (see checkpoint.py)
+    """
+    q_table = DirtyQTable() if checkpoint_dir else {}
     q_player_1 = QLearningPlayer('X', q_table, training_mode=True)
     q_player_2 = QLearningPlayer('O', q_table, training_mode=True)
-    game = Connect4()
-    train_q_learning_player(q_player_1, q_player_2, game, num_episodes=num_episodes)
-
-
-def minimaxVSrandom(n=100, minimax_first=True):
-    mini = MiniMaxPlayer('', pruning=True, depth=5)
-    random = SmartRandomComputerPlayer('')
-    init_record(mini, random)
-    for i in range(n):
-        c = Connect4()
-        if minimax_first:
-            play(c, mini, random, print_game=False)
-        else:
-            play(c, random, mini, print_game=False)
-    print(results, timer, moves)
-    print("winning rate of MiniMax player:", results[mini.__class__.__name__] / n)
-    print("tie rate:", results['tie'] / n)
-    print("Average Move Count for MiniMax Player:", moves[mini.__class__.__name__] / n)
-    print("Average Response Time for MiniMax Player:", timer[mini.__class__.__name__] / moves[mini.__class__.__name__])
-
-
-def qVSrandom(n=100, q_first=True):
+    checkpointer = None
+    start_episode = 0
+    if checkpoint_dir:
+        checkpointer = Checkpointer(checkpoint_dir, q_table, flags=FLAG_CANONICAL if q_player_1.symmetry else 0)
+        start_episode = checkpointer.restore((q_player_1, q_player_2))
+    try:
+        if workers > 1:
+            train_parallel(q_player_1, q_player_2, Connect4, play_training_episode, num_episodes, workers=workers,
+                           sync_every=sync_every, seed=seed, checkpointer=checkpointer, start_episode=start_episode)
+            q_player_1.save_q_table(Q_TABLE_PATH)
+            return
+        game = Connect4()
+        train_q_learning_player(q_player_1, q_player_2, game, num_episodes=num_episodes, checkpointer=checkpointer,
+                                checkpoint_every=checkpoint_every, start_episode=start_episode)
+    finally:
+        if checkpointer is not None:
+            checkpointer.close()
+
+
+def q_learning_player():
     q_player = QLearningPlayer('', training_mode=False)
     q_player.load_q_table(Q_TABLE_PATH)
-    random = SmartRandomComputerPlayer('')
-    init_record(q_player, random)
-    for i in range(n):
-        c = Connect4()
-        if q_first:
-            play(c, q_player, random, print_game=False)
-        else:
-            play(c, random, q_player, print_game=False)
-    # print(results, timer, moves)
-    print("winning rate of Q player:", results[q_player.__class__.__name__] / n)
-    print("tie rate:", results['tie'] / n)
-    print("Average Move Count for Q Player:", moves[q_player.__class__.__name__] / n)
-    print("Average Response Time for Q Player:",
-          timer[q_player.__class__.__name__] / moves[q_player.__class__.__name__])
+    return q_player
 
 
-def minimaxVSq(n=100, minimax_first=True):
-    mini = MiniMaxPlayer('', pruning=True, depth=5)
-    q_player = QLearningPlayer('', training_mode=False)
-    q_player.load_q_table(Q_TABLE_PATH)
-    init_record(mini, q_player)
-    for i in range(n):
-        c = Connect4()
-        if minimax_first:
-            play(c, mini, q_player, print_game=False)
-        else:
-            play(c, q_player, mini, print_game=False)
-    # print(results, timer, moves)
-    print("winning rate of MiniMax player:", results[mini.__class__.__name__] / n)
-    print("winning rate of Q player:", results[q_player.__class__.__name__] / n)
-    print("tie rate:", results['tie'] / n)
-    print("Average Move Count for MiniMax Player:", moves[mini.__class__.__name__] / n)
-    print("Average Move Count for Q Player:", moves[q_player.__class__.__name__] / n)
-    print("Average Response Time for MiniMax Player:", timer[mini.__class__.__name__] / moves[mini.__class__.__name__])
-    print("Average Response Time for Q Player:",
-          timer[q_player.__class__.__name__] / moves[q_player.__class__.__name__])
+def compare(players, n=100, workers=None, output=None):
+    """
+    Compare players with a tournament: every pair of players plays n games with each player moving first
+    :param players: {name: callable returning a new player}
+    :param workers: number of processes to play the games on
+    :param output: write the results to this .json or .csv file
+    :return: the results of tournament.run_tournament
+    """
+    results = run_tournament(Connect4, players, games_per_pairing=n, workers=workers)
+    print_results(results)
+    if output:
+        save_results(results, output)
+    return results
 
 
 if __name__ == '__main__':
     # Compare the performance of different players
     # ==============================================================================================================
     print("MiniMax vs Random\n")
-    print("MiniMax First")
-    minimaxVSrandom(2, minimax_first=True)
-    # print("\nRandom First")
-    # minimaxVSrandom(50, minimax_first=False)
+    compare({'MiniMax': partial(MiniMaxPlayer, '', pruning=True, depth=6),
+             'SmartRandom': partial(SmartRandomComputerPlayer, '')}, n=1)
     #
     # print("\n\n\nQ vs Random\n")
-    # print("Q First")
-    # qVSrandom(50, q_first=True)
-    # print("\nRandom First")
-    # qVSrandom(50, q_first=False)
+    # compare({'Q-learning': q_learning_player, 'SmartRandom': partial(SmartRandomComputerPlayer, '')}, n=50)
     #
     # print("\n\n\nMiniMax vs Q\n")
-    # print("MiniMax First")
-    # minimaxVSq(50, minimax_first=True)
-    # print("\nQ First")
-    # minimaxVSq(50, minimax_first=False)
+    # compare({'MiniMax': partial(MiniMaxPlayer, '', pruning=True, depth=6), 'Q-learning': q_learning_player}, n=50)
+    #
+    # print("\n\n\nMCTS vs MiniMax\n")
+    # MCTS needs several times the ~5 ms/move of depth-5 MiniMax to beat it
+    # from .player import MCTSPlayer
+    # compare({'MCTS': partial(MCTSPlayer, '', time_limit_ms=50), 'MiniMax': partial(MiniMaxPlayer, '', depth=5)}, n=50)
 
     # ==============================================================================================================
     # Train the Q-learning player
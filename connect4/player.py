@@ -5,9 +5,33 @@ A HumanPlayer Class
 A RandomComputerPlayer Class
 A SmartRandomComputerPlayer Class
 A MiniMaxPlayer Class
+A MCTSPlayer Class
+A BookPlayer Class
 A QLearningPlayer Class
 """
+import ast
 import random
+import time
+from multiprocessing import Pool, current_process
+
+from consts import CONNECT4_BOOK_PATH
+from qtable import FLAG_CANONICAL, MappedQTable, is_binary_q_table, load_binary_q_table, read_flags, \
+    save_binary_q_table
+from mcts import DEFAULT_ITERATIONS, EXPLORATION, MonteCarloTreeSearch
+from move_ordering import MoveOrderer
+from search import SearchEngine
+from search_stats import SearchStats
+from transposition import REPLACE_DEPTH
+from .book import OpeningBook
+from .solver import Connect4Solver, outcome
+from .game import CENTER_FIRST_COLUMNS, HEIGHT, IDENTITY_COLUMNS, WIDTH, board_to_key, canonical_state, key_after_move
+
+
+# window of the aspiration search around the previous iteration's score, the value of a three-stone threat
+ASPIRATION_WINDOW = 100
+# empty cells from which on to solve the game exactly, for players that ask for it; solving took at most ~20 ms
+# with 14 empty cells on random positions, against seconds for some positions with 18 or more
+SOLVE_BELOW = 14
 
 
 def other_letter(letter):
@@ -30,6 +54,12 @@ class RandomComputerPlayer(Player):
         square = random.choice(game.available_moves())
         return square
 
+    def get_moves(self, vec_game):
+        """
+        A random move for every game of a vectorized game (see vec_env.py)
+        """
+        return vec_game.random_moves()
+
 
 class SmartRandomComputerPlayer(Player):
     """
@@ -79,76 +109,268 @@ class HumanPlayer(Player):
         return val
 
 
+# the search engine of a process of MiniMaxPlayer's pool, kept between moves like the player's own engine
+_worker_engine = None
+_worker_search_id = None
+
+
+def _init_search_worker(tt_size, tt_replacement, move_ordering):
+    global _worker_engine
+    _worker_engine = SearchEngine(tt_size, tt_replacement,
+                                  move_orderer=MoveOrderer(CENTER_FIRST_COLUMNS) if move_ordering else None)
+
+
+def _score_root_move(task):
+    """Score one root move in a worker: (score, nodes searched)"""
+    global _worker_search_id
+    search_id, game, player, move, depth, alpha, pruning = task
+    if search_id != _worker_search_id:
+        _worker_engine.new_search(game)
+        _worker_search_id = search_id
+    nodes = _worker_engine.nodes
+    score = _worker_engine.score_move(game, player, move, depth, alpha, pruning=pruning)
+    return score, _worker_engine.nodes - nodes
+
+
 class MiniMaxPlayer(Player):
-    def __init__(self, letter, pruning=True, depth=4):
+    """
+    Depth-limited minimax player, a thin wrapper around search.SearchEngine.
+    With pruning, the engine runs alpha-beta negamax with PVS and caches results in a Zobrist-hashed
+    transposition table that is kept between moves (set tt_size=0 to disable it).
+    With time_limit_ms, the player searches with iterative deepening instead of a fixed depth: it searches
+    depth 1, 2, 3, ... until the budget runs out and plays the best move of the deepest finished iteration,
+    searching each depth in an aspiration window around the previous score.
+    With move_ordering, the pruning search tries winning moves, blocks, killer moves and moves with a good
+    history first, and the rest from the center out (see move_ordering.py).
+    With workers > 1, the fixed-depth search is split at the root over a process pool that is started on the
+    first move and kept until close() (or the end of a `with` block, or the player being garbage collected):
+    the first root move is searched to get a bound, then the other moves are searched in parallel against that
+    bound, each worker keeping its own transposition table. The parallel and the serial search both play the
+    first move in column order with the best score. In a daemonic process, e.g. a worker of a tournament's
+    pool, which cannot start processes of its own, the player searches serially.
+    With solve_below (e.g. SOLVE_BELOW), positions with at most that many empty cells are solved to the end of
+    the game instead (see solver.py); last_score is then a solver score, and last_outcome tells whether the
+    move wins, draws or loses and in how many plies.
+    With book_path, the moves of the positions in the opening book built by connect4/book.py are looked up
+    instead of searched.
+    With collect_stats, last_stats holds the search_stats.SearchStats of the last move; the parallel search
+    only counts the nodes of its workers.
+    """
+
+    def __init__(self, letter, pruning=True, depth=4, tt_size=1 << 20, tt_replacement=REPLACE_DEPTH,
+                 time_limit_ms=None, move_ordering=True, aspiration_window=ASPIRATION_WINDOW, workers=None,
+                 solve_below=None, weak_solve=False, book_path=None, collect_stats=False):
+        """
+        :param solve_below: number of empty cells from which on the game is solved exactly, None to never solve
+        :param weak_solve: only solve for a win, draw or loss, without the distance, which is faster but neither
+                           wins by the shortest way nor holds out the longest in a lost position
+        :param book_path: the opening book, e.g. consts.CONNECT4_BOOK_PATH, or None to always search
+        :raise FileNotFoundError: if the book has not been built
+        :param collect_stats: collect the statistics of every move, which slows the search down
+        """
         super().__init__(letter)
+        if workers and workers > 1 and time_limit_ms is not None:
+            raise ValueError("The parallel search needs a fixed depth, not a time limit")
         self.pruning = pruning
         self.depth = depth  # Max depth limit
+        self.time_limit_ms = time_limit_ms
+        # the workers' engines are set up like the player's own
+        self._worker_options = (tt_size, tt_replacement, move_ordering)
+        self.engine = SearchEngine(tt_size, tt_replacement,
+                                   move_orderer=MoveOrderer(CENTER_FIRST_COLUMNS) if move_ordering else None,
+                                   aspiration_window=aspiration_window, collect_stats=collect_stats)
+        self.workers = workers
+        self._pool = None
+        self._search_id = 0
+        self.last_score = None  # score of the last move for self.letter
+        self.solve_below = solve_below
+        self.weak_solve = weak_solve
+        self.solver = Connect4Solver() if solve_below else None
+        self.last_outcome = None  # (WIN, DRAW or LOSS, plies to the winning stone) of a solved last move
+        self.book = OpeningBook.load(book_path) if book_path is not None else None
+        self.collect_stats = collect_stats
+        self.last_stats = None
+
+    @property
+    def last_depth(self):
+        """depth of the search that chose the last move"""
+        return self.engine.depth
+
+    @property
+    def nodes(self):
+        """nodes searched for the last move"""
+        if self.last_outcome is not None:
+            return self.solver.nodes
+        return self.engine.nodes
+
+    def effective_branching_factor(self):
+        """
+        The branching factor of a uniform tree of the last search's depth with as many nodes as were searched
+        """
+        if self.engine.depth == 0 or self.engine.nodes == 0:
+            return 0.0
+        return self.engine.nodes ** (1 / self.engine.depth)
 
     def get_move(self, game):
         if len(game.available_moves()) == 0:
             return None
+        self.last_outcome = None
+        start = time.perf_counter() if self.collect_stats else None
+        if self.book is not None:
+            entry = self.book.lookup(game)
+            if entry is not None:
+                self.engine.nodes = self.engine.depth = 0
+                move, self.last_score = entry
+                self._lookup_stats('book', start)
+                return move
+        if self.solver is not None and game.num_empty_squares() <= self.solve_below:
+            move, self.last_score = self.solver.best_move(game, self.letter, self.weak_solve)
+            self.last_outcome = outcome(self.last_score, WIDTH * HEIGHT - game.num_empty_squares(), self.weak_solve)
+            self._lookup_stats('solver', start, self.solver.nodes, game.num_empty_squares())
+            return move
+        if self.workers and self.workers > 1 and not current_process().daemon:
+            self.last_score, move = self.parallel_search(game)
+        elif not self.pruning:
+            self.last_score, move = self.engine.search_without_pruning(game, self.letter, self.depth)
+        elif self.time_limit_ms is not None:
+            self.last_score, move = self.engine.iterative_deepening(game, self.letter, self.time_limit_ms)
+        else:
+            self.last_score, move = self.engine.search(game, self.letter, self.depth)
+        self.last_stats = self.engine.stats
+        return move
+
+    def _lookup_stats(self, source, start, nodes=0, depth=0):
+        """Stats of a move that was not searched by the engine"""
+        if start is None:
+            return
+        self.last_stats = stats = SearchStats(source)
+        stats.nodes = nodes
+        stats.depth = depth
+        stats.time = time.perf_counter() - start
+
+    def parallel_search(self, game):
+        """
+        Root-split search on the process pool
+        :return: (score for self.letter, best move)
+        """
+        if self._pool is None:
+            self._pool = Pool(self.workers, initializer=_init_search_worker, initargs=self._worker_options)
+        self.engine.new_search(game)
+        self.engine.depth = self.depth
+        self._search_id += 1
+        # plain minimax goes through the moves in the game's order
+        moves = self.engine.root_moves(game, self.letter, self.depth) if self.pruning else game.available_moves()
+        tasks = [(self._search_id, game, self.letter, move, self.depth, -float('inf'), self.pruning)
+                 for move in moves]
+        # the first move gives the bound the other moves are searched against, as in the serial search;
+        # one less than it, so that a move that ties is scored exactly and can win the tie
+        best_score, nodes = self._pool.apply(_score_root_move, (tasks[0],))
+        best_move = moves[0]
         if self.pruning:
-            return self.minimax_with_alpha_beta_pruning(game, self.letter, -float('inf'), float('inf'), self.depth)[
-                'position']
+            tasks = [task[:5] + (best_score - 1,) + task[6:] for task in tasks[1:]]
         else:
-            return self.minimax(game, self.letter, self.depth)['position']
-
-    def minimax(self, state, player, depth):
-        if depth == 0 or state.current_winner is not None or not state.empty_squares():
-            return {'position': None, 'score': state.evaluate(player)}
-
-        max_player = self.letter
-        other_player = other_letter(player)
-        best = {'position': None, 'score': -float('inf') if player == max_player else float('inf')}
-
-        for possible_move in state.available_moves():
-            position = state.make_move(possible_move, player)
-            sim_score = self.minimax(state, other_player, depth - 1)
-            state.board[position[0]][position[1]] = ' '  # reset the board
-            state.current_winner = None
-            sim_score['position'] = possible_move
-
-            if player == max_player and sim_score['score'] > best['score'] or player != max_player and sim_score[
-                'score'] < best['score']:
-                best = sim_score
-
-        return best
-
-    def minimax_with_alpha_beta_pruning(self, state, player, alpha, beta, depth):
-        if depth == 0 or state.current_winner is not None or not state.empty_squares():
-            return {'position': None, 'score': state.evaluate(player)}
-
-        max_player = self.letter
-        other_player = other_letter(player)
-        best = {'position': None, 'score': -float('inf') if player == max_player else float('inf')}
-
-        for possible_move in state.available_moves():
-            position = state.make_move(possible_move, player)
-            sim_score = self.minimax_with_alpha_beta_pruning(state, other_player, alpha, beta, depth - 1)
-            state.board[position[0]][position[1]] = ' '  # reset the board
-            state.current_winner = None
-            sim_score['position'] = possible_move
-
-            if player == max_player:
-                if sim_score['score'] > best['score']:
-                    best = sim_score
-                    alpha = max(alpha, sim_score['score'])
-                    if beta <= alpha:
-                        break
-            else:
-                if sim_score['score'] < best['score']:
-                    best = sim_score
-                    beta = min(beta, sim_score['score'])
-                    if beta <= alpha:
-                        break
+            tasks = tasks[1:]
+        ranks = self.engine.move_ranks(game)
+        for move, (score, move_nodes) in zip(moves[1:], self._pool.map(_score_root_move, tasks, chunksize=1)):
+            nodes += move_nodes
+            # ties go to the first move in the game's order, as in the serial search
+            if score > best_score or score == best_score and ranks[move] < ranks[best_move]:
+                best_score, best_move = score, move
+        self.engine.nodes = nodes + 1
+        self.engine.finish_stats()
+        return best_score, best_move
+
+    def close(self):
+        """Stop the worker processes of the parallel search"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # __init__ may have failed before the pool was set up
+        if getattr(self, '_pool', None) is not None:
+            self._pool.terminate()
+
+
+class MCTSPlayer(Player):
+    """
+    Monte Carlo Tree Search player, a thin wrapper around mcts.MonteCarloTreeSearch.
+    It runs `iterations` iterations per move, or searches for time_limit_ms, and keeps its tree between moves.
+    Playouts win and block on the spot and play randomly otherwise (Connect4.playout).
+    It is weaker than MiniMaxPlayer at equal time per move: depth-5 MiniMax takes ~5 ms a move, and MCTS only
+    beats it with about 30 ms or more.
+    """
 
-        return best
+    def __init__(self, letter, iterations=None, time_limit_ms=None, rollouts=1, exploration=EXPLORATION, seed=None):
+        """
+        :param iterations: iterations per move, DEFAULT_ITERATIONS if neither budget is given
+        :param time_limit_ms: time budget per move; with both budgets the first one reached ends the search
+        :param rollouts: playouts per new node of the tree
+        """
+        super().__init__(letter)
+        if iterations is None and time_limit_ms is None:
+            iterations = DEFAULT_ITERATIONS
+        self.engine = MonteCarloTreeSearch(iterations, time_limit_ms, rollouts, exploration, seed)
+
+    @property
+    def nodes(self):
+        """iterations of the last move"""
+        return self.engine.nodes
+
+    def get_move(self, game):
+        if len(game.available_moves()) == 0:
+            return None
+        return self.engine.search(game, self.letter)
+
+
+class BookPlayer(Player):
+    """
+    Wraps any player: moves of the positions in the opening book are looked up, and the other moves are left to
+    the wrapped player.
+    """
+
+    def __init__(self, player, book_path=CONNECT4_BOOK_PATH):
+        """
+        :param player: the player that moves once the game leaves the book
+        :raise FileNotFoundError: if the book has not been built
+        """
+        self.player = player
+        super().__init__(player.letter)
+        self.book = OpeningBook.load(book_path)
+        self.book_moves = 0  # moves answered from the book
+
+    @property
+    def letter(self):
+        return self.player.letter
+
+    @letter.setter
+    def letter(self, letter):
+        self.player.letter = letter
+
+    def get_move(self, game):
+        entry = self.book.lookup(game)
+        if entry is not None:
+            self.book_moves += 1
+            return entry[0]
+        return self.player.get_move(game)
 
 
 class QLearningPlayer(Player):
+    """
+    Tabular Q-learning player.
+    With symmetry, a board and its mirror image share one Q-table entry:
+    states are mapped to their canonical representative and columns are mirrored along with them.
+    """
+
     def __init__(self, letter, q_table=None, training_mode=False, alpha=0.9, alpha_decay=0.999, alpha_min=0.1,
-                 gamma=0.8, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01):
+                 gamma=0.8, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01, symmetry=True):
         super().__init__(letter)
         self.alpha = alpha
         self.alpha_decay = alpha_decay
@@ -160,21 +382,46 @@ class QLearningPlayer(Player):
         self.q_table = {} if q_table is None else q_table
         self.state_history = []
         self.training_mode = training_mode
+        self.symmetry = symmetry
 
     def save_q_table(self, filename):
-        with open(filename, 'w') as f:
-            for key, value in self.q_table.items():
-                state, action = key
-                f.write(f"{state};{action};{value}\n")
+        save_binary_q_table(self.q_table, filename, flags=FLAG_CANONICAL if self.symmetry else 0)
 
     def load_q_table(self, filename):
+        """
+        Load a binary Q-table, or a text Q-table written by older versions.
+        Outside training mode a binary table is memory-mapped read-only instead of being loaded into a dict.
+        The player uses symmetry if and only if the table was saved with it.
+        """
+        if is_binary_q_table(filename):
+            self.symmetry = bool(read_flags(filename) & FLAG_CANONICAL)
+            if self.training_mode:
+                self.q_table.update(load_binary_q_table(filename))
+            else:
+                self.q_table = MappedQTable(filename)
+            return
+        # text tables have one "state;action;value" line per entry, with the board as a tuple of rows,
+        # and were saved without symmetry
+        self.symmetry = False
         with open(filename, 'r') as f:
             for line in f:
                 state, action, value = line.strip().split(';')
-                self.q_table[(eval(state), int(action))] = float(value)
+                self.q_table[(board_to_key(ast.literal_eval(state)), int(action))] = float(value)
 
     def get_state(self, game):
-        return tuple([tuple(row) for row in game.board])
+        return game.state_id
+
+    def canonical(self, state):
+        """
+        :return: (the state used as Q-table key, a tuple mapping each column of `state` to the Q-table's column)
+        """
+        if not self.symmetry:
+            return state, IDENTITY_COLUMNS
+        return canonical_state(state)
+
+    def q_key(self, state, action):
+        q_state, actions = self.canonical(state)
+        return q_state, actions[action]
 
     def get_move(self, game):
         state = self.get_state(game)
@@ -185,16 +432,17 @@ class QLearningPlayer(Player):
         else:
             move = self.choose_best_move(state, available_moves)
 
-        self.state_history.append((state, move))
+        self.state_history.append(self.q_key(state, move))
 
         self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
         return move
 
     def choose_best_move(self, state, available_moves):
+        q_state, actions = self.canonical(state)
         best_value = -float('inf')
         best_move = None
         for move in available_moves:
-            value = self.q_table.get((state, move), 0)
+            value = self.q_table.get((q_state, actions[move]), 0)
             if value > best_value:
                 best_value = value
                 best_move = move
@@ -202,21 +450,15 @@ class QLearningPlayer(Player):
 
     def update_q_values(self, reward):
         self.delta = 0
+        # the history holds Q-table keys, so the states here are already canonical
         for state, action in reversed(self.state_history):
             self.alpha = max(self.alpha * self.alpha_decay, self.alpha_min)
             old_q_value = self.q_table.get((state, action), 0)
             future_rewards = []
-            available_moves = [col for col in range(7) if state[0][col] == ' ']
-            for next_move in available_moves:
-                future_state = list(state)
-                for row in range(5, -1, -1):
-                    if future_state[row][next_move] == ' ':
-                        future_state[row] = list(future_state[row])
-                        future_state[row][next_move] = self.letter
-                        future_state[row] = tuple(future_state[row])
-                        break
-                future_state = tuple(future_state)
-                future_rewards.append(self.q_table.get((future_state, next_move), 0))
+            for next_move in range(WIDTH):
+                future_state = key_after_move(state, next_move, self.letter)
+                if future_state is not None:
+                    future_rewards.append(self.q_table.get(self.q_key(future_state, next_move), 0))
             max_future_reward = max(future_rewards) if future_rewards else 0
             new_q_value = old_q_value + self.alpha * (reward + self.gamma * max_future_reward - old_q_value)
             self.delta += abs(new_q_value - old_q_value)
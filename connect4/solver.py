@@ -0,0 +1,196 @@
+"""
+This file is for solving Connect4 endgames exactly
+A Connect4Solver Class
+
+The solver searches to the end of the game on two bitboards (the stones of the player to move and all stones),
+with alpha-beta, a transposition table and null-window searches.
+A score is from the point of view of the player to move, as in search.py:
+    > 0  the player to move wins; the earlier the win, the higher the score: (43 - stones before the winning
+         move) // 2, so a win on the spot is worth (43 - stones on the board) // 2
+    0    a draw
+    < 0  the opponent wins, with the negated score of the opponent's win
+A weak solve only tells a win from a draw from a loss (-1, 0 or 1), and is much faster.
+"""
+from transposition import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
+from .game import BOARD_CELLS, BOTTOM_CELLS, CENTER_FIRST_COLUMNS, COLUMN_CELLS, HEIGHT, WIDTH, \
+    winning_cells
+
+NUM_CELLS = WIDTH * HEIGHT
+WIN = 'win'
+DRAW = 'draw'
+LOSS = 'loss'
+
+
+def _non_losing_moves(current, mask):
+    """
+    The cells the player to move can play without letting the opponent win on the next move, as a bitboard
+    """
+    possible = (mask + BOTTOM_CELLS) & BOARD_CELLS
+    opponent_wins = winning_cells(current ^ mask) & ~mask
+    forced = possible & opponent_wins
+    if forced:
+        # two threats cannot both be blocked
+        if forced & (forced - 1):
+            return 0
+        possible = forced
+    # a stone right below a winning cell of the opponent lets the opponent play there
+    return possible & ~(opponent_wins >> 1)
+
+
+def outcome(score, stones, weak=False):
+    """
+    :param score: a solver score for the player to move
+    :param stones: the number of stones on the board
+    :param weak: the score is from a weak solve, which has no distance
+    :return: (WIN, DRAW or LOSS, number of plies until the winning stone is dropped, 0 for a draw and None
+             after a weak solve)
+    """
+    if score == 0:
+        return DRAW, 0
+    if weak:
+        return (WIN if score > 0 else LOSS), None
+    # the winning move is dropped on a board with 43 - 2 * |score| or 42 - 2 * |score| stones, and the
+    # winner moves on boards with an even number of stones more than now, or an odd number for the opponent
+    stones_before = 43 - 2 * abs(score)
+    winner_offset = 0 if score > 0 else 1
+    if (stones_before - stones - winner_offset) % 2:
+        stones_before -= 1
+    return (WIN if score > 0 else LOSS), stones_before - stones + 1
+
+
+class Connect4Solver:
+    """
+    Exact solver for Connect4 positions. The transposition table is kept between solves: its entries are
+    bounds on exact scores, so they stay true for any later position.
+    """
+
+    def __init__(self, tt_size=1 << 20):
+        self.transposition_table = TranspositionTable(tt_size)
+        self.nodes = 0
+
+    def solve(self, game, letter, weak=False):
+        """
+        :param letter: the player to move
+        :param weak: only find out whether the position is won, drawn or lost
+        :return: the score for `letter`
+        """
+        current = game.bitboards[letter]
+        mask = game.bitboards['X'] | game.bitboards['O']
+        self.nodes = 0
+        self.transposition_table.new_search()
+        return self._solve(current, mask, NUM_CELLS - game.num_empty_squares(), weak)
+
+    def _solve(self, current, mask, stones, weak=False):
+        if winning_cells(current) & (mask + BOTTOM_CELLS) & BOARD_CELLS:
+            return (NUM_CELLS + 1 - stones) // 2 if not weak else 1
+        low, high = -((NUM_CELLS - stones) // 2), (NUM_CELLS + 1 - stones) // 2
+        if weak:
+            low, high = -1, 1
+        # narrow the score down with null-window searches, which are the cheapest to fail;
+        # trying around 0 first settles the outcome before its distance
+        while low < high:
+            guess = low + (high - low) // 2
+            if guess <= 0 and low // 2 < guess:
+                guess = low // 2
+            elif guess >= 0 and high // 2 > guess:
+                guess = high // 2
+            score = self.negamax(current, mask, stones, guess, guess + 1)
+            if score <= guess:
+                high = score
+            else:
+                low = score
+        if weak:
+            return max(-1, min(1, low))
+        return low
+
+    def best_move(self, game, letter, weak=False):
+        """
+        :return: (the best column for `letter`, its score); ties go to the column nearest the center
+        """
+        current = game.bitboards[letter]
+        mask = game.bitboards['X'] | game.bitboards['O']
+        stones = NUM_CELLS - game.num_empty_squares()
+        self.nodes = 0
+        self.transposition_table.new_search()
+        score = self._solve(current, mask, stones, weak)
+        possible = (mask + BOTTOM_CELLS) & BOARD_CELLS
+        columns = [col for col in CENTER_FIRST_COLUMNS if possible & COLUMN_CELLS[col]]
+        wins = winning_cells(current) & possible
+        if wins:
+            return next(col for col in columns if wins & COLUMN_CELLS[col]), score
+        non_losing = [col for col in columns if _non_losing_moves(current, mask) & COLUMN_CELLS[col]]
+        for col in non_losing:
+            move = possible & COLUMN_CELLS[col]
+            # the move is best if the opponent cannot do better than -score after it
+            if self._child_score(current | move, mask | move, stones + 1, -score) <= -score:
+                return col, score
+        # a weak solve of a lost position does not know which move holds out longest
+        return (non_losing or columns)[0], score
+
+    def _child_score(self, current, mask, stones, target):
+        """A bound on the opponent's score after our move, which is <= target if and only if the score is"""
+        return self.negamax(current ^ mask, mask, stones, target, target + 1)
+
+    def negamax(self, current, mask, stones, alpha, beta):
+        """
+        Alpha-beta search to the end of the game; the player to move must not be able to win on the spot
+        :param current: the stones of the player to move
+        :param mask: all stones
+        :param stones: the number of stones on the board
+        :return: the exact score if it is inside (alpha, beta), otherwise a bound on the same side
+        """
+        self.nodes += 1
+        moves = _non_losing_moves(current, mask)
+        if not moves:
+            # the opponent wins with its next stone
+            return -((NUM_CELLS - stones) // 2)
+        if stones >= NUM_CELLS - 2:
+            # neither player can win with the last two stones
+            return 0
+
+        # the opponent cannot win on its next move, so the score is at least this
+        low = -((NUM_CELLS - 2 - stones) // 2)
+        if alpha < low:
+            alpha = low
+            if alpha >= beta:
+                return alpha
+        key = current + mask
+        table = self.transposition_table
+        entry = table.probe(key)
+        # we cannot win on this move, so the score is at most this
+        high = (NUM_CELLS - 1 - stones) // 2
+        if entry is not None:
+            if entry.flag == EXACT:
+                return entry.score
+            if entry.flag == LOWER_BOUND:
+                if entry.score > alpha:
+                    alpha = entry.score
+                    if alpha >= beta:
+                        return alpha
+            elif entry.score < high:
+                high = entry.score
+        if beta > high:
+            beta = high
+            if alpha >= beta:
+                return beta
+
+        # moves that create the most winning cells first, then from the center out
+        ordered = []
+        for col in CENTER_FIRST_COLUMNS:
+            move = moves & COLUMN_CELLS[col]
+            if move:
+                threats = (winning_cells(current | move) & ~(mask | move)).bit_count()
+                ordered.append((-threats, len(ordered), move))
+        ordered.sort()
+
+        alpha_orig = alpha
+        empty = NUM_CELLS - stones
+        for _, _, move in ordered:
+            score = -self.negamax(current ^ mask, mask | move, stones + 1, -beta, -alpha)
+            if score >= beta:
+                table.store(key, empty, LOWER_BOUND, score, None)
+                return score
+            if score > alpha:
+                alpha = score
+        table.store(key, empty, UPPER_BOUND if alpha <= alpha_orig else EXACT, alpha, None)
+        return alpha
@@ -0,0 +1,148 @@
+"""
+This file is for playing many Connect4 games in lockstep with NumPy (see vec_env.py)
+
+The games are stored as uint64 bitboards with the bit layout of connect4/game.py (bit col * 7 + row, row 0 at
+the bottom), so state ids and wins are computed with the same shifts and masks, for all games at once.
+"""
+import numpy as np
+
+from qtable import ACTION_BITS, pack_key
+from vec_env import NO_WINNER, X, random_legal_moves
+from .game import COLUMN_BITS, COLUMN_MASK, DIRECTIONS, FOLDED_COLUMNS, HEIGHT, IDENTITY_COLUMNS, \
+    MIRRORED_COLUMNS, WIDTH
+
+# column maps of canonical_state, indexed by 0 (identity), 1 (mirrored) and 2 (symmetric board)
+_COLUMN_MAPS = np.array([IDENTITY_COLUMNS, MIRRORED_COLUMNS, FOLDED_COLUMNS], dtype=np.uint64)
+_BOTTOM_CELLS = np.array([1 << col * COLUMN_BITS for col in range(WIDTH)], dtype=np.uint64)
+_TOP_CELLS = _BOTTOM_CELLS << np.uint64(HEIGHT - 1)
+_COLUMNS = np.array([COLUMN_MASK << col * COLUMN_BITS for col in range(WIDTH)], dtype=np.uint64)
+# the bit of every cell of a (6, 7) board, row 0 at the top
+_CELL_BITS = np.array([[col * COLUMN_BITS + HEIGHT - 1 - row for col in range(WIDTH)] for row in range(HEIGHT)],
+                      dtype=np.uint64)
+
+
+def has_four(bitboards):
+    """has_four of connect4/game.py for a uint64 array of bitboards"""
+    found = np.zeros(bitboards.shape, dtype=bool)
+    for shift in DIRECTIONS:
+        shift = np.uint64(shift)
+        pairs = bitboards & (bitboards >> shift)
+        found |= (pairs & (pairs >> (shift + shift))) != 0
+    return found
+
+
+def mirror_keys(keys):
+    """mirror_key of connect4/game.py for a uint64 array of keys"""
+    mirrored = np.zeros_like(keys)
+    for col in range(WIDTH):
+        column = (keys >> np.uint64(col * COLUMN_BITS)) & np.uint64(COLUMN_MASK)
+        mirrored |= column << np.uint64((WIDTH - 1 - col) * COLUMN_BITS)
+    return mirrored
+
+
+class VecConnect4:
+    """
+    K Connect4 games played in lockstep. Finished games are reset by step().
+    x_boards holds the 'X' stones of every game and stones holds all stones, so the state id is their sum.
+    """
+
+    num_actions = WIDTH
+
+    def __init__(self, num_games, seed=None):
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+        self.x_boards = np.zeros(num_games, dtype=np.uint64)
+        self.stones = np.zeros(num_games, dtype=np.uint64)
+        self.num_moves = np.zeros(num_games, dtype=np.int8)
+        self.turns = np.full(num_games, X, dtype=np.int8)
+
+    def reset(self):
+        self._reset_games(slice(None))
+
+    def _reset_games(self, done):
+        self.x_boards[done] = 0
+        self.stones[done] = 0
+        self.num_moves[done] = 0
+        self.turns[done] = X
+
+    @property
+    def state_ids(self):
+        """The board_to_key encoding of every game, as a uint64 array"""
+        return self.x_boards + self.stones
+
+    @property
+    def boards(self):
+        """The (K, 6, 7) int8 boards of connect4/batch.py: 0 for empty, 1 for 'X', 2 for 'O'"""
+        x_cells = (self.x_boards[:, None, None] >> _CELL_BITS) & np.uint64(1)
+        cells = (self.stones[:, None, None] >> _CELL_BITS) & np.uint64(1)
+        return (2 * cells - x_cells).astype(np.int8)
+
+    def legal_moves(self):
+        """(K, 7) bool array of the columns that are not full"""
+        return self.stones[:, None] & _TOP_CELLS == 0
+
+    def random_moves(self):
+        return random_legal_moves(self.legal_moves(), self.rng)
+
+    def step(self, actions, active=None):
+        """
+        Drop a stone of the letter to move into actions[i] in every game i
+        :param actions: one column per game
+        :param active: bool array of the games to play; the other games are left as they are
+        :return: (winners, done): the winner of every game (NO_WINNER, X or O) and whether it ended with this
+                 move; finished games have been reset when this returns
+        :raise ValueError: if a column is full or out of range
+        """
+        games = slice(None) if active is None else np.flatnonzero(active)
+        cols = np.asarray(actions)[games]
+        if np.any((cols < 0) | (cols >= WIDTH)):
+            raise ValueError("Invalid move: the column is out of range")
+        stones = self.stones[games]
+        if np.any(stones & _TOP_CELLS[cols]):
+            raise ValueError("Invalid move: the column is full")
+        # adding the bottom bit of the column carries up to its lowest empty cell
+        bits = (stones + _BOTTOM_CELLS[cols]) & _COLUMNS[cols]
+        turns = self.turns[games]
+        x_moves = turns == X
+        stones |= bits
+        x_boards = self.x_boards[games] | np.where(x_moves, bits, np.uint64(0))
+        self.stones[games] = stones
+        self.x_boards[games] = x_boards
+        num_moves = self.num_moves[games] + 1
+        self.num_moves[games] = num_moves
+        # only the mover's stones can have made a four
+        won = has_four(np.where(x_moves, x_boards, stones ^ x_boards))
+        winners = np.full(self.num_games, NO_WINNER, dtype=np.int8)
+        winners[games] = np.where(won, turns, NO_WINNER)
+        done = np.zeros(self.num_games, dtype=bool)
+        done[games] = won | (num_moves == WIDTH * HEIGHT)
+        self.turns[games] = 3 - turns
+        self._reset_games(done)
+        return winners, done
+
+    @staticmethod
+    def q_lookup(q_table, symmetry):
+        """
+        A snapshot of a QLearningPlayer's Q-table for EpsilonGreedyPolicy
+        :return: fn(state ids) -> (K, 7) array of Q-values, 0 for missing entries
+        """
+        entries = sorted((pack_key(state, action), value) for (state, action), value in q_table.items())
+        keys = np.array([key for key, _ in entries], dtype=np.uint64)
+        values = np.array([value for _, value in entries], dtype=np.float64)
+
+        def lookup(state_ids):
+            if symmetry:
+                mirrored = mirror_keys(state_ids)
+                q_states = np.minimum(state_ids, mirrored)
+                maps = np.where(mirrored < state_ids, 1, np.where(mirrored == state_ids, 2, 0))
+                q_actions = _COLUMN_MAPS[maps]
+            else:
+                q_states = state_ids
+                q_actions = _COLUMN_MAPS[np.zeros(len(state_ids), dtype=np.intp)]
+            if len(keys) == 0:
+                return np.zeros(q_actions.shape)
+            packed = (q_states[:, None] << np.uint64(ACTION_BITS)) | q_actions
+            index = np.minimum(np.searchsorted(keys, packed), len(keys) - 1)
+            return np.where(keys[index] == packed, values[index], 0.0)
+
+        return lookup
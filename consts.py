@@ -1,13 +1,19 @@
-PLAYERS = ["Random", "SmartRandom", "Q-learning", "Minimax", "Human"]
+PLAYERS = ["Random", "SmartRandom", "Q-learning", "Minimax", "MCTS", "Human"]
 RANDOM = "Random"
 SMART_RANDOM = "SmartRandom"
 Q_LEARNING = "Q-learning"
 MINIMAX = "Minimax"
+MCTS = "MCTS"
 HUMAN = "Human"
 
 GAMES = ["ttt", "connect4"]
 TIC_TAC_TOE = "ttt"
 CONNECT4 = "connect4"
 
-TTT_Q_TABLE_PATH = "./tictactoe/q_table.txt"
-CONNECT4_Q_TABLE_PATH = "./connect4/q_table.txt"
+TTT_Q_TABLE_PATH = "./tictactoe/q_table.bin"
+CONNECT4_Q_TABLE_PATH = "./connect4/q_table.bin"
+# text Q-tables written by older versions, converted to the binary format on first use
+TTT_LEGACY_Q_TABLE_PATH = "./tictactoe/q_table.txt"
+CONNECT4_LEGACY_Q_TABLE_PATH = "./connect4/q_table.txt"
+TTT_SOLVED_TABLE_PATH = "./tictactoe/solved_table.bin"
+CONNECT4_BOOK_PATH = "./connect4/opening_book.bin"
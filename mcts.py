@@ -0,0 +1,174 @@
+"""
+This file is for the Monte Carlo Tree Search shared by the MCTS players
+A Node Class
+A MonteCarloTreeSearch Class
+
+Every iteration walks down the tree from the root, picking children by UCT, adds one child for a move that
+has not been tried yet, plays the game out from there and counts the result in every node on the way back.
+The move played is the most visited child of the root. The tree is kept between moves: the subtree of the
+position the opponent's reply led to becomes the new root.
+
+The search runs on any game with available_moves(), make_move(move, letter), undo_move(move), game_over(),
+current_winner, position_hash and copy(), plus
+    playout(letter, rng)    play the game out from the position with `letter` to move, on a compact copy of
+                            the board that leaves the game untouched
+                            :return: the winning letter, or None for a tie
+and, optionally, winning_moves(letter), which lets the root play a win and block a loss without searching.
+"""
+import math
+import random
+import time
+
+OTHER_LETTER = {'X': 'O', 'O': 'X'}
+# the exploration constant of UCT; the textbook sqrt(2) explores too much for the few thousand iterations
+# a move gets here, 0.7 played best against MiniMaxPlayer on Connect4
+EXPLORATION = 0.7
+# iterations per move of the players when they get no budget
+DEFAULT_ITERATIONS = 1000
+
+
+class Node:
+    """
+    A position of the tree. `letter` made `move` to get here, and `wins` counts the playouts won by `letter`,
+    a tie counting as half a win.
+    """
+
+    __slots__ = ('move', 'letter', 'parent', 'children', 'untried', 'visits', 'wins', 'key')
+
+    def __init__(self, move, letter, parent, untried, key):
+        self.move = move
+        self.letter = letter
+        self.parent = parent
+        self.children = []
+        self.untried = untried  # moves without a child yet
+        self.visits = 0
+        self.wins = 0.0
+        self.key = key  # position hash of the game at this node
+
+    def select_child(self, exploration):
+        """The child with the highest UCT value: its win rate plus a bonus for being visited little"""
+        log_visits = math.log(self.visits)
+        best_value = -1.0
+        best_child = None
+        for child in self.children:
+            value = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best_value, best_child = value, child
+        return best_child
+
+
+class MonteCarloTreeSearch:
+    """
+    UCT search with an iteration or time budget per move; the tree is kept between moves.
+    """
+
+    def __init__(self, iterations=None, time_limit_ms=None, rollouts=1, exploration=EXPLORATION, seed=None):
+        """
+        :param iterations: number of iterations per move
+        :param time_limit_ms: time budget per move; with both budgets the search stops at the first one reached
+        :param rollouts: playouts per new node; more than one gives a less noisy first estimate of the node for
+                         the cost of one walk down the tree
+        :param exploration: the UCT exploration constant
+        :param seed: seed of the playouts' random number generator
+        """
+        if iterations is None and time_limit_ms is None:
+            raise ValueError("MCTS needs an iteration or a time budget")
+        self.iterations = iterations
+        self.time_limit_ms = time_limit_ms
+        self.rollouts = rollouts
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.root = None
+        # statistics of the last search
+        self.nodes = 0  # iterations of the last move
+        self.playouts = 0
+        self.reused_visits = 0  # visits of the root that were kept from the previous move
+
+    def _find_root(self, game, letter):
+        """The node of the current position in the kept tree, or a new root"""
+        key = game.position_hash
+        root = self.root
+        if root is not None:
+            if root.key == key and OTHER_LETTER[root.letter] == letter:
+                return root
+            # the opponent has replied to our last move
+            for child in root.children:
+                if child.key == key and child.letter != letter:
+                    child.parent = None
+                    return child
+        return Node(None, OTHER_LETTER[letter], None, game.available_moves(), key)
+
+    def search(self, game, letter):
+        """
+        :return: the move for `letter`
+        """
+        self.nodes = self.playouts = 0
+        if hasattr(game, 'winning_moves'):
+            # wins and forced blocks need no search
+            moves = game.winning_moves(letter) or game.winning_moves(OTHER_LETTER[letter])
+            if moves:
+                self.root = None
+                return moves[0]
+        root = self._find_root(game, letter)
+        self.reused_visits = root.visits
+        game = game.copy()
+        deadline = None
+        if self.time_limit_ms is not None:
+            deadline = time.perf_counter() + self.time_limit_ms / 1000
+        iterations = self.iterations
+        while iterations is None or self.nodes < iterations:
+            self._iterate(root, game)
+            self.nodes += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        best = max(root.children, key=lambda child: child.visits)
+        self.root = best
+        return best.move
+
+    def _iterate(self, root, game):
+        node = root
+        played = []
+        # selection: walk down the fully expanded nodes
+        while not node.untried and node.children:
+            node = node.select_child(self.exploration)
+            game.make_move(node.move, node.letter)
+            played.append(node.move)
+        # expansion: add one child for an untried move
+        if node.untried and not game.game_over():
+            move = node.untried.pop(int(self.rng.random() * len(node.untried)))
+            letter = OTHER_LETTER[node.letter]
+            game.make_move(move, letter)
+            played.append(move)
+            child = Node(move, letter, node, [] if game.game_over() else game.available_moves(), game.position_hash)
+            node.children.append(child)
+            node = child
+        # simulation: a finished game counts its result once per rollout, like a playout would
+        rollouts = self.rollouts
+        wins = {'X': 0.0, 'O': 0.0}
+        if game.game_over():
+            winner = game.current_winner
+            if winner is None:
+                wins['X'] = wins['O'] = rollouts / 2
+            else:
+                wins[winner] = rollouts
+        else:
+            to_move = OTHER_LETTER[node.letter]
+            for _ in range(rollouts):
+                winner = game.playout(to_move, self.rng)
+                if winner is None:
+                    wins['X'] += 0.5
+                    wins['O'] += 0.5
+                else:
+                    wins[winner] += 1
+            self.playouts += rollouts
+        # backpropagation
+        while node is not None:
+            node.visits += rollouts
+            node.wins += wins[node.letter]
+            node = node.parent
+        for move in reversed(played):
+            game.undo_move(move)
+
+    def clear(self):
+        """Forget the tree, e.g. before a new game"""
+        self.root = None
@@ -0,0 +1,78 @@
+"""
+This file is for ordering moves in alpha-beta search
+A MoveOrderer Class
+
+Alpha-beta prunes the most when the best move is searched first. The orderer puts the moves of a node in
+this order:
+1. the hash move: the best move found for the position before (transposition table or principal variation)
+2. urgent moves given by the caller, e.g. moves that win on the spot, then moves that block a win
+3. killer moves: quiet moves that caused a cutoff at the same ply in a sibling branch
+4. the other moves by history score (cutoffs they caused anywhere in the search, weighted by depth),
+   ties broken by a static order such as center-first
+"""
+
+NUM_KILLERS = 2
+
+
+class MoveOrderer:
+    def __init__(self, static_order, num_killers=NUM_KILLERS):
+        """
+        :param static_order: all moves of the game, most promising first
+        :param num_killers: number of killer moves kept per ply
+        """
+        self.static_order = tuple(static_order)
+        self.num_killers = num_killers
+        self.killers = []  # killers[ply] is the list of killer moves at that ply, newest first
+        self.history = {}  # player -> {move: history score}
+
+    def clear(self):
+        self.killers = []
+        self.history = {}
+
+    def new_search(self):
+        """
+        Start a new search: killers are forgotten (the plies refer to another root now) and history scores
+        are halved so that the current position weighs more than older ones
+        """
+        self.killers = []
+        self.history = {player: {move: score // 2 for move, score in scores.items() if score > 1}
+                        for player, scores in self.history.items()}
+
+    def order(self, moves, ply, player, hash_move=None, urgent=()):
+        """
+        :param moves: the legal moves of the node
+        :param ply: distance of the node from the root
+        :param player: the player to move, history scores are kept per player
+        :param hash_move: the move to search first, if it is legal
+        :param urgent: moves to search right after the hash move, in this order
+        :return: a new list of the moves, best candidates first
+        """
+        ordered = [hash_move] if hash_move in moves else []
+        for move in urgent:
+            if move not in ordered:
+                ordered.append(move)
+        if ply < len(self.killers):
+            for move in self.killers[ply]:
+                if move in moves and move not in ordered:
+                    ordered.append(move)
+        rest = [move for move in self.static_order if move in moves and move not in ordered]
+        history = self.history.get(player)
+        if history:
+            # the sort is stable, so moves with the same history score stay in static order
+            rest.sort(key=lambda move: -history.get(move, 0))
+        return ordered + rest
+
+    def cutoff(self, move, ply, player, depth):
+        """
+        Record that `move` refuted the node at `ply` with `depth` plies left to search
+        """
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move in killers:
+            killers.remove(move)
+        killers.insert(0, move)
+        del killers[self.num_killers:]
+        history = self.history.setdefault(player, {})
+        # deep cutoffs save more work, so they count more
+        history[move] = history.get(move, 0) + depth * depth
@@ -0,0 +1,128 @@
+"""
+This file is for training Q-learning players with self-play on several processes
+
+Training runs in rounds of `sync_every` episodes:
+1. the master writes its Q-table to a binary snapshot file
+2. every worker memory-maps the snapshot and plays its share of the round's episodes, learning as usual
+   but keeping its updates in a private overlay instead of the snapshot
+3. the workers send back the change of every entry they touched, and the master adds them all to its
+   table, worker by worker, so that the next round starts from everyone's experience
+
+Each worker seeds `random` from (seed, round, worker), so a run is reproducible for a given seed and
+number of workers.
+"""
+import copy
+import os
+import random
+import tempfile
+from multiprocessing import Pool
+
+from qtable import FLAG_CANONICAL, MappedQTable, save_binary_q_table
+
+
+class OverlayQTable:
+    """
+    A writable Q-table on top of a read-only one: reads fall through to the base table, writes stay local
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.changes = {}
+
+    def get(self, key, default=None):
+        if key in self.changes:
+            return self.changes[key]
+        return self.base.get(key, default)
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            return self.changes[key]
+        return self.base[key]
+
+    def __setitem__(self, key, value):
+        self.changes[key] = value
+
+    def __contains__(self, key):
+        return key in self.changes or key in self.base
+
+
+def _detach(player):
+    """A copy of the player without its Q-table and history, cheap to send to a worker"""
+    detached = copy.copy(player)
+    detached.q_table = None
+    detached.state_history = []
+    return detached
+
+
+def _run_batch(task):
+    snapshot_path, q_player, opponent, game_factory, episode_fn, num_episodes, seed = task
+    random.seed(seed)
+    snapshot = MappedQTable(snapshot_path)
+    q_table = OverlayQTable(snapshot)
+    q_player.q_table = opponent.q_table = q_table
+    game = game_factory()
+    # every move decays epsilon once and is replayed in exactly one alpha-decaying update step
+    steps = [0, 0]
+    reward = 0
+    for _ in range(num_episodes):
+        reward = episode_fn(q_player, opponent, game)
+        steps[0] += len(q_player.state_history)
+        steps[1] += len(opponent.state_history)
+        q_player.update_q_values(reward)
+        opponent.update_q_values(-reward)
+    deltas = {key: value - snapshot.get(key, 0) for key, value in q_table.changes.items()}
+    snapshot.close()
+    return deltas, steps, reward
+
+
+def _decay(player, steps):
+    player.alpha = max(player.alpha * player.alpha_decay ** steps, player.alpha_min)
+    player.epsilon = max(player.epsilon * player.epsilon_decay ** steps, player.epsilon_min)
+
+
+def train_parallel(q_player, opponent, game_factory, episode_fn, num_episodes, workers=None, sync_every=1000,
+                   seed=0, checkpointer=None, start_episode=0):
+    """
+    Self-play training on a process pool
+    :param q_player: a QLearningPlayer in training mode; its q_table dict is updated in place
+    :param opponent: the other QLearningPlayer, sharing q_player's q_table
+    :param game_factory: creates an empty game, e.g. the game class
+    :param episode_fn: plays one episode, fn(q_player, opponent, game) -> q_player's reward, without updating
+    :param workers: number of worker processes (os.cpu_count() if None)
+    :param sync_every: number of episodes between two snapshots of the Q-table
+    :param seed: seed of the workers' random number generators
+    :param checkpointer: a checkpoint.Checkpointer to save the progress to after every round
+    :param start_episode: the number of episodes already played, when resuming from a checkpoint
+    """
+    workers = workers or os.cpu_count()
+    flags = FLAG_CANONICAL if getattr(q_player, 'symmetry', False) else 0
+    with tempfile.TemporaryDirectory() as tmp_dir, Pool(workers) as pool:
+        snapshot_path = os.path.join(tmp_dir, 'snapshot.bin')
+        episodes_done = start_episode
+        # checkpoints are taken between rounds, so a resumed run goes on with the next round's seeds
+        round_index = start_episode // sync_every
+        while episodes_done < num_episodes:
+            round_episodes = min(sync_every, num_episodes - episodes_done)
+            # float64 values, so that the snapshot holds exactly what the master has
+            save_binary_q_table(q_player.q_table, snapshot_path, typecode='d', flags=flags)
+            tasks = []
+            for worker in range(workers):
+                share = round_episodes // workers + (worker < round_episodes % workers)
+                if share:
+                    tasks.append((snapshot_path, _detach(q_player), _detach(opponent), game_factory, episode_fn,
+                                  share, f"{seed}:{round_index}:{worker}"))
+            q_steps = opponent_steps = 0
+            reward = 0
+            for deltas, steps, reward in pool.map(_run_batch, tasks):
+                for key, delta in deltas.items():
+                    q_player.q_table[key] = q_player.q_table.get(key, 0) + delta
+                q_steps += steps[0]
+                opponent_steps += steps[1]
+            _decay(q_player, q_steps)
+            _decay(opponent, opponent_steps)
+            episodes_done += round_episodes
+            round_index += 1
+            if checkpointer is not None:
+                checkpointer.checkpoint(episodes_done, (q_player, opponent))
+            print(f"Episode {episodes_done}: Q-Player learns with reward {reward}")
+            print("Q-table size:", len(q_player.q_table))
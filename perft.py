@@ -0,0 +1,165 @@
+"""
+This file is for perft: counting the positions a given number of plies away, as a check of the move generation
+and a measure of its speed
+
+perft(d) is the number of move sequences of d plies from the position, a finished game ending a sequence
+early; a position d plies away counts even if its last move won. It only uses available_moves, make_move,
+undo_move and current_winner, so it works on any board representation of the two games, and the counts from
+the empty board must match PERFT_RESULTS. The last ply is counted without being played ("bulk counting"),
+since it takes no more than the number of moves.
+
+The search can be split over a process pool: the positions a few plies from the root are counted in parallel,
+as many tasks as keep every worker busy.
+
+Run `python perft.py <ttt | connect4> <depth> [-w workers] [--divide] [--check]` from the project root.
+"""
+import argparse
+import os
+import time
+from multiprocessing import Pool
+
+from consts import CONNECT4, GAMES, TIC_TAC_TOE
+
+OTHER_LETTER = {'X': 'O', 'O': 'X'}
+# perft(0), perft(1), ... from the empty board
+PERFT_RESULTS = {
+    TIC_TAC_TOE: (1, 9, 72, 504, 3024, 15120, 54720, 148176, 200448, 127872),
+    CONNECT4: (1, 7, 49, 343, 2401, 16807, 117649, 823536, 5673234, 39394572),
+}
+# positions per worker to split the root into, so that uneven subtrees even out
+TASKS_PER_WORKER = 8
+
+
+def new_game(game_name):
+    if game_name == TIC_TAC_TOE:
+        from tictactoe.game import TicTacToe
+        return TicTacToe()
+    from connect4.game import Connect4
+    return Connect4()
+
+
+def perft(game, letter, depth):
+    """
+    :param letter: the player to move
+    :return: the number of positions `depth` plies away
+    """
+    if depth == 0:
+        return 1
+    moves = game.available_moves()
+    if depth == 1:
+        return len(moves)
+    other = OTHER_LETTER[letter]
+    nodes = 0
+    for move in moves:
+        game.make_move(move, letter)
+        # a won game has no more moves
+        if game.current_winner is None:
+            nodes += perft(game, other, depth - 1)
+        game.undo_move(move)
+    return nodes
+
+
+def divide(game, letter, depth):
+    """
+    :return: {root move: perft(depth - 1) after it}, to find the move whose count is wrong
+    """
+    counts = {}
+    for move in game.available_moves():
+        game.make_move(move, letter)
+        counts[move] = perft(game, OTHER_LETTER[letter], depth - 1) if game.current_winner is None else 0
+        game.undo_move(move)
+    return counts
+
+
+def _split(game, letter, plies, prefix=()):
+    """
+    The move sequences of `plies` plies from the position, a won game ending a sequence early
+    :return: a list of (moves, whether the sequence ended early)
+    """
+    if plies == 0:
+        return [(prefix, False)]
+    sequences = []
+    for move in game.available_moves():
+        game.make_move(move, letter)
+        if game.current_winner is None:
+            sequences.extend(_split(game, OTHER_LETTER[letter], plies - 1, prefix + (move,)))
+        else:
+            sequences.append((prefix + (move,), True))
+        game.undo_move(move)
+    return sequences
+
+
+def _perft_task(task):
+    game, letter, moves, depth = task
+    for move in moves:
+        game.make_move(move, letter)
+        letter = OTHER_LETTER[letter]
+    return perft(game, letter, depth)
+
+
+def parallel_perft(game, letter, depth, workers=None):
+    """
+    perft on a process pool of `workers` processes
+    """
+    if depth <= 2:
+        return perft(game, letter, depth)
+    workers = workers or os.cpu_count()
+    # split as deep as it takes to get enough tasks, leaving at least two plies to every task
+    plies = 1
+    sequences = _split(game, letter, plies)
+    while len(sequences) < TASKS_PER_WORKER * workers and plies < depth - 2:
+        plies += 1
+        sequences = _split(game, letter, plies)
+    tasks = [(game, letter, moves, depth - plies) for moves, ended in sequences if not ended]
+    with Pool(workers) as pool:
+        return sum(pool.imap_unordered(_perft_task, tasks))
+
+
+def check(game_name, depth, workers=None):
+    """
+    Compare perft(1) .. perft(depth) from the empty board with PERFT_RESULTS
+    :return: True if every count matches
+    """
+    expected = PERFT_RESULTS[game_name]
+    ok = True
+    for d in range(min(depth, len(expected) - 1) + 1):
+        if workers:
+            count = parallel_perft(new_game(game_name), 'X', d, workers)
+        else:
+            count = perft(new_game(game_name), 'X', d)
+        status = 'ok' if count == expected[d] else f'expected {expected[d]}'
+        ok &= count == expected[d]
+        print(f"perft({d}) = {count} {status}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the positions a number of plies from the empty board")
+    parser.add_argument('game', choices=GAMES)
+    parser.add_argument('depth', type=int)
+    parser.add_argument('-w', '--workers', type=int, help="split the search over this many processes")
+    parser.add_argument('--divide', action='store_true', help="print the count after every root move")
+    parser.add_argument('--check', action='store_true', help="check every depth up to `depth` with the references")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if check(args.game, args.depth, args.workers) else 1)
+    game = new_game(args.game)
+    if args.divide:
+        for move, count in divide(game, 'X', args.depth).items():
+            print(f"{move}: {count}")
+    start = time.perf_counter()
+    if args.workers:
+        nodes = parallel_perft(game, 'X', args.depth, args.workers)
+    else:
+        nodes = perft(game, 'X', args.depth)
+    elapsed = time.perf_counter() - start
+    expected = PERFT_RESULTS[args.game]
+    status = ''
+    if args.depth < len(expected):
+        status = ' ok' if nodes == expected[args.depth] else f' expected {expected[args.depth]}'
+    print(f"perft({args.depth}) = {nodes}{status}")
+    print(f"{elapsed:.3f} s, {nodes / elapsed if elapsed > 0 else 0:,.0f} nodes/s")
+
+
+if __name__ == "__main__":
+    main()
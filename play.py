@@ -1,5 +1,7 @@
-from consts import GAMES, PLAYERS, RANDOM, SMART_RANDOM, Q_LEARNING, MINIMAX, HUMAN
+from consts import GAMES, PLAYERS, RANDOM, SMART_RANDOM, Q_LEARNING, MINIMAX, MCTS, HUMAN
+import os
 import sys
+from functools import partial
 
 
 def play(game, first_mover, second_mover, print_game=True):
@@ -16,8 +18,9 @@ def play(game, first_mover, second_mover, print_game=True):
 
 def _play_ttt(first_mover, second_mover, print_game):
     from tictactoe.main import play, init_record
-    from tictactoe.player import RandomComputerPlayer, SmartRandomComputerPlayer, QLearningPlayer, MiniMaxPlayer, HumanPlayer
-    from consts import TTT_Q_TABLE_PATH
+    from tictactoe.player import RandomComputerPlayer, SmartRandomComputerPlayer, QLearningPlayer, MiniMaxPlayer, HumanPlayer, \
+        MCTSPlayer
+    from consts import TTT_Q_TABLE_PATH, TTT_LEGACY_Q_TABLE_PATH
     from tictactoe.game import TicTacToe
     if first_mover == Q_LEARNING or second_mover == Q_LEARNING:
         # check if Q-table exists
@@ -25,20 +28,24 @@ def _play_ttt(first_mover, second_mover, print_game):
             with open(TTT_Q_TABLE_PATH, "r") as f:
                 pass
         except FileNotFoundError:
-            print("Q-table not found.")
-            is_training_now = input("Do you want to train now? (y/n) ")
-            if is_training_now == "y":
-                from tictactoe.main import train
-                train(100000)
-                print("Training complete.")
+            if os.path.exists(TTT_LEGACY_Q_TABLE_PATH):
+                _convert_legacy_q_table(QLearningPlayer, TTT_LEGACY_Q_TABLE_PATH, TTT_Q_TABLE_PATH)
             else:
-                print("Training aborted.")
-                return
+                print("Q-table not found.")
+                is_training_now = input("Do you want to train now? (y/n) ")
+                if is_training_now == "y":
+                    from tictactoe.main import train
+                    train(100000)
+                    print("Training complete.")
+                else:
+                    print("Training aborted.")
+                    return
     players = {
         RANDOM: RandomComputerPlayer,
         SMART_RANDOM: SmartRandomComputerPlayer,
         Q_LEARNING: QLearningPlayer,
         MINIMAX: MiniMaxPlayer,
+        MCTS: MCTSPlayer,
         HUMAN: HumanPlayer
     }
     first_mover_class = players[first_mover]
@@ -61,8 +68,9 @@ def _play_ttt(first_mover, second_mover, print_game):
 
 def _play_connect4(first_mover, second_mover, print_game):
     from connect4.main import play, init_record
-    from connect4.player import RandomComputerPlayer, SmartRandomComputerPlayer, QLearningPlayer, MiniMaxPlayer, HumanPlayer
-    from consts import CONNECT4_Q_TABLE_PATH
+    from connect4.player import RandomComputerPlayer, SmartRandomComputerPlayer, QLearningPlayer, MiniMaxPlayer, HumanPlayer, \
+        MCTSPlayer, SOLVE_BELOW
+    from consts import CONNECT4_Q_TABLE_PATH, CONNECT4_LEGACY_Q_TABLE_PATH
     from connect4.game import Connect4
     if first_mover == Q_LEARNING or second_mover == Q_LEARNING:
         # check if Q-table exists
@@ -70,20 +78,25 @@ def _play_connect4(first_mover, second_mover, print_game):
             with open(CONNECT4_Q_TABLE_PATH, "r") as f:
                 pass
         except FileNotFoundError:
-            print("Q-table not found. Training Q-learning player...")
-            is_training_now = input("Do you want to train now? (y/n) ")
-            if is_training_now == "y":
-                from connect4.main import train
-                train(10000)
-                print("Training complete.")
+            if os.path.exists(CONNECT4_LEGACY_Q_TABLE_PATH):
+                _convert_legacy_q_table(QLearningPlayer, CONNECT4_LEGACY_Q_TABLE_PATH, CONNECT4_Q_TABLE_PATH)
             else:
-                print("Training aborted.")
-                return
+                print("Q-table not found. Training Q-learning player...")
+                is_training_now = input("Do you want to train now? (y/n) ")
+                if is_training_now == "y":
+                    from connect4.main import train
+                    train(10000)
+                    print("Training complete.")
+                else:
+                    print("Training aborted.")
+                    return
     players = {
         RANDOM: RandomComputerPlayer,
         SMART_RANDOM: SmartRandomComputerPlayer,
         Q_LEARNING: QLearningPlayer,
-        MINIMAX: MiniMaxPlayer,
+        # endgames are played perfectly against a human
+        MINIMAX: partial(MiniMaxPlayer, solve_below=SOLVE_BELOW),
+        MCTS: MCTSPlayer,
         HUMAN: HumanPlayer
     }
     first_mover_class = players[first_mover]
@@ -104,6 +117,13 @@ def _play_connect4(first_mover, second_mover, print_game):
     play(Connect4(), first_mover, second_mover, print_game)
 
 
+def _convert_legacy_q_table(q_player_class, legacy_path, path):
+    print("Converting", legacy_path, "to", path)
+    q_player = q_player_class('', training_mode=True)
+    q_player.load_q_table(legacy_path)
+    q_player.save_q_table(path)
+
+
 def _parse_input():
     if len(sys.argv) < 4:
         raise ValueError("Usage: python play.py <game> <first_mover> <second_mover> [print_game](y/n)")
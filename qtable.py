@@ -0,0 +1,267 @@
+"""
+This file is for the binary Q-table format shared by the Q-learning players
+
+Layout (little-endian):
+    header  magic b'AIQT', version (uint16), value typecode (1 char), flags (uint8), entry count (uint64)
+    keys    entry count x uint64, sorted ascending; a key is (state << ACTION_BITS) | action
+    values  entry count x float32 (typecode 'f') or float64 (typecode 'd'), in the same order as the keys
+
+Because the keys are sorted, a table can be used straight from a read-only mmap of the file (MappedQTable),
+or from a copy of the file in shared memory (SharedQTable), looking entries up by binary search instead of
+building a dict of Python objects. Either way, many processes share one physical copy of the table; on a
+big-endian machine, every process looks entries up in a byteswapped copy of its own instead.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from multiprocessing import shared_memory
+
+MAGIC = b'AIQT'
+VERSION = 1
+HEADER = struct.Struct('<4sHcBQ')
+# flags: the states are canonical representatives of their symmetry class
+FLAG_CANONICAL = 1
+# actions are column or square numbers, so 4 bits are enough for both games
+ACTION_BITS = 4
+ACTION_MASK = (1 << ACTION_BITS) - 1
+
+
+def pack_key(state, action):
+    return state << ACTION_BITS | action
+
+
+def unpack_key(key):
+    return key >> ACTION_BITS, key & ACTION_MASK
+
+
+def is_binary_q_table(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_flags(filename):
+    with open(filename, 'rb') as f:
+        return _read_header(f.read(HEADER.size), filename)[2]
+
+
+def _pack_entries(q_table, encode_state, typecode):
+    """:return: (keys, values) arrays of the table, sorted by key, in little-endian byte order"""
+    entries = []
+    for (state, action), value in q_table.items():
+        if encode_state is not None:
+            state = encode_state(state)
+        entries.append((pack_key(state, action), value))
+    entries.sort()
+    keys = array('Q', [key for key, _ in entries])
+    values = array(typecode, [value for _, value in entries])
+    if sys.byteorder == 'big':
+        keys.byteswap()
+        values.byteswap()
+    return keys, values
+
+
+def save_binary_q_table(q_table, filename, encode_state=None, typecode='f', flags=0):
+    """
+    Write a {(state, action): value} dict in the binary format
+    :param encode_state: turns a state into a non-negative int; states are used as they are if None
+    :param typecode: 'f' for float32 values, 'd' for float64 values
+    :param flags: FLAG_* bits describing the table
+    """
+    keys, values = _pack_entries(q_table, encode_state, typecode)
+    # write next to the target and rename, so that readers never see a half-written table
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, typecode.encode(), flags, len(keys)))
+        keys.tofile(f)
+        values.tofile(f)
+    os.replace(tmp_filename, filename)
+
+
+def _read_header(buffer, filename):
+    magic, version, typecode, flags, count = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{filename} is not a binary Q-table")
+    if version != VERSION:
+        raise ValueError(f"{filename} has unsupported Q-table version {version}")
+    return typecode.decode(), count, flags
+
+
+def load_binary_q_table(filename, decode_state=None):
+    """
+    Read a binary Q-table into a {(state, action): value} dict
+    :param decode_state: turns an encoded int back into a state; states stay ints if None
+    """
+    with open(filename, 'rb') as f:
+        typecode, count, _ = _read_header(f.read(HEADER.size), filename)
+        keys = array('Q')
+        keys.fromfile(f, count)
+        values = array(typecode)
+        values.fromfile(f, count)
+    if sys.byteorder == 'big':
+        keys.byteswap()
+        values.byteswap()
+    q_table = {}
+    for key, value in zip(keys, values):
+        state, action = unpack_key(key)
+        if decode_state is not None:
+            state = decode_state(state)
+        q_table[(state, action)] = value
+    return q_table
+
+
+class _PackedQTable:
+    """
+    A read-only Q-table over a buffer in the binary format.
+    It supports the dict operations the players use for lookups: get, [], in and len.
+    """
+
+    def _open(self, buffer, source, encode_state):
+        self.encode_state = encode_state
+        typecode, self._count, self.flags = _read_header(buffer, source)
+        self._buffer = memoryview(buffer)
+        values_offset = HEADER.size + 8 * self._count
+        keys = self._buffer[HEADER.size:values_offset]
+        values = self._buffer[values_offset:values_offset + array(typecode).itemsize * self._count]
+        if sys.byteorder == 'big':
+            # the buffer is little-endian, so it cannot be used in place
+            self._keys, self._values = array('Q'), array(typecode)
+            self._keys.frombytes(keys)
+            self._values.frombytes(values)
+            self._keys.byteswap()
+            self._values.byteswap()
+        else:
+            self._keys = keys.cast('Q')
+            self._values = values.cast(typecode)
+        keys.release()
+        values.release()
+
+    def _index(self, key):
+        state, action = key
+        if self.encode_state is not None:
+            state = self.encode_state(state)
+        packed = pack_key(state, action)
+        index = bisect_left(self._keys, packed)
+        if index < self._count and self._keys[index] == packed:
+            return index
+        return -1
+
+    def get(self, key, default=None):
+        index = self._index(key)
+        return self._values[index] if index >= 0 else default
+
+    def __getitem__(self, key):
+        index = self._index(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._values[index]
+
+    def __contains__(self, key):
+        return self._index(key) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        for packed, value in zip(self._keys, self._values):
+            state, action = unpack_key(packed)
+            yield (state, action), value
+
+    def _release(self):
+        if isinstance(self._keys, memoryview):
+            self._keys.release()
+            self._values.release()
+        self._buffer.release()
+
+
+class MappedQTable(_PackedQTable):
+    """
+    A read-only Q-table backed by a memory-mapped binary Q-table file.
+    Opening it is instant and its pages are shared by every process that maps the same file.
+    It is pickled as its filename, so a player sent to a worker process maps the file instead of copying it.
+    """
+
+    def __init__(self, filename, encode_state=None):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._open(self._mmap, filename, encode_state)
+
+    def __reduce__(self):
+        return MappedQTable, (self.filename, self.encode_state)
+
+    def close(self):
+        self._release()
+        self._mmap.close()
+
+
+class SharedQTable(_PackedQTable):
+    """
+    A read-only Q-table in a multiprocessing.shared_memory block, in the binary format, for tables that are not
+    on disk (or not on a disk that can be mapped). One process creates the block with SharedQTable.create and
+    the others attach to it by name; every process reads the same physical copy.
+    It is pickled as its name, so a player sent to a worker process attaches instead of copying the table.
+    The creator calls unlink() once no process needs the table any more.
+    On Python < 3.13, attaching registers the block with the process's resource tracker, which removes it when
+    the process ends: attach from processes started by the creator with multiprocessing, which share its tracker.
+    """
+
+    def __init__(self, name, encode_state=None):
+        """Attach to the block of an existing table"""
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(name, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+        self.name = self._shm.name
+        self._open(self._shm.buf, name, encode_state)
+
+    @classmethod
+    def create(cls, q_table, encode_state=None, typecode='f', flags=0, name=None):
+        """
+        Copy a {(state, action): value} dict into a new shared memory block
+        :param encode_state, typecode, flags: as in save_binary_q_table
+        :param name: the name of the block, a random one if None
+        """
+        keys, values = _pack_entries(q_table, encode_state, typecode)
+        header = HEADER.pack(MAGIC, VERSION, typecode.encode(), flags, len(keys))
+        return cls._create(name, encode_state, header, keys.tobytes(), values.tobytes())
+
+    @classmethod
+    def from_file(cls, filename, encode_state=None, name=None):
+        """Copy a binary Q-table file into a new shared memory block"""
+        with open(filename, 'rb') as f:
+            data = f.read()
+        _read_header(data, filename)
+        return cls._create(name, encode_state, data)
+
+    @classmethod
+    def _create(cls, name, encode_state, *chunks):
+        shm = shared_memory.SharedMemory(name, create=True, size=sum(len(chunk) for chunk in chunks))
+        offset = 0
+        for chunk in chunks:
+            shm.buf[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        table = cls.__new__(cls)
+        table._shm = shm
+        table.name = shm.name
+        table._open(shm.buf, shm.name, encode_state)
+        return table
+
+    def __reduce__(self):
+        return SharedQTable, (self.name, self.encode_state)
+
+    def close(self):
+        """Detach from the block"""
+        self._release()
+        self._shm.close()
+
+    def __del__(self):
+        # SharedMemory cannot close its mapping while the views into it are alive, so release them first
+        if hasattr(self, '_keys'):
+            self.close()
+
+    def unlink(self):
+        """Free the block; processes that are still attached keep their mapping until they close it"""
+        self._shm.unlink()
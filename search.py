@@ -0,0 +1,394 @@
+"""
+This file is for the game tree search shared by the MiniMax players
+A SearchTimeout Class
+A SearchEngine Class
+
+The engine runs negamax with alpha-beta pruning and principal variation search on any game that follows
+this protocol:
+    available_moves()            the legal moves
+    make_move(move, letter)      play a move
+    undo_move(move)              take the last move in that column/square back
+    game_over()                  True at terminal positions
+    evaluate(letter)             integer score for `letter`, with evaluate('X') == -evaluate('O')
+    position_hash                int identifying the position, for the transposition table
+Two optional methods make it faster:
+    winning_moves(letter)                        moves that win on the spot, searched first
+    evaluate_after_move(move, letter, player)    evaluate(player) after `letter` plays `move`, without playing it
+
+Scores are from the point of view of the player to move, so one function serves both sides.
+PVS searches the first move of a node with the full window and the others with a null window, which is
+cheap to fail; only a move that beats the first one is searched again with the full window. It relies on
+integer scores, since the null window is (alpha, alpha + 1).
+"""
+import time
+
+from search_stats import InstrumentedGame, SearchStats
+from transposition import EXACT, LOWER_BOUND, REPLACE_DEPTH, UPPER_BOUND, TranspositionTable
+
+INFINITY = float('inf')
+OTHER_LETTER = {'X': 'O', 'O': 'X'}
+# mixed into the position hash when 'O' is to move, so that both sides get their own entries
+SIDE_TO_MOVE_KEY = 0x9E3779B97F4A7C15
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget of the current move runs out"""
+
+
+class SearchEngine:
+    """
+    Negamax with alpha-beta pruning, PVS, a transposition table (tt_size=0 disables it), optional move
+    ordering and iterative deepening with aspiration windows.
+    The table and the move orderer are kept between searches.
+    With collect_stats, every search leaves a search_stats.SearchStats in self.stats.
+    """
+
+    def __init__(self, tt_size=1 << 20, tt_replacement=REPLACE_DEPTH, move_orderer=None, pvs=True,
+                 aspiration_window=None, collect_stats=False):
+        """
+        :param move_orderer: a move_ordering.MoveOrderer, or None to search the moves in the game's order
+                             (after the hash move, if there is a transposition table)
+        :param pvs: search all moves but the first with a null window
+        :param aspiration_window: with iterative deepening, search each depth with a window of this size
+                                  around the previous score, and again with the full window if it fails
+        :param collect_stats: fill self.stats during every search, which slows the search down
+        """
+        self.transposition_table = TranspositionTable(tt_size, tt_replacement) if tt_size else None
+        self.move_orderer = move_orderer
+        self.pvs = pvs
+        self.aspiration_window = aspiration_window
+        self._deadline = None
+        self._pv_moves = {}  # position hash -> move along the principal variation of the last iteration
+        self._leaf_scores = False
+        self._urgent_moves = False
+        self.best_move = None
+        # statistics of the last search
+        self.depth = 0
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0  # cutoffs by the first move searched, a measure of the ordering quality
+        self.researches = 0  # PVS and aspiration re-searches
+        self.collect_stats = collect_stats
+        self.stats = None  # the SearchStats of the last search, with collect_stats
+        self._stats_start = None  # (time, table hits, table misses) at the start of the search
+
+    def new_search(self, game):
+        """Reset the statistics and age the tables before searching a new position"""
+        self.nodes = self.cutoffs = self.first_move_cutoffs = self.researches = 0
+        self._pv_moves = {}
+        self._leaf_scores = hasattr(game, 'evaluate_after_move')
+        self._urgent_moves = hasattr(game, 'winning_moves')
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        if self.move_orderer is not None:
+            self.move_orderer.new_search()
+        if self.collect_stats:
+            self.stats = SearchStats()
+            table = self.transposition_table
+            hits, misses = (table.hits, table.misses) if table is not None else (0, 0)
+            self._stats_start = (time.perf_counter(), hits, misses)
+
+    def _instrument(self, game):
+        """The game to search: the game itself, or a wrapper that measures it when collecting stats"""
+        return InstrumentedGame(game, self.stats) if self.stats is not None else game
+
+    def finish_stats(self):
+        """Copy the counters of the search that just ended to self.stats"""
+        stats = self.stats
+        if stats is None:
+            return
+        start, hits, misses = self._stats_start
+        stats.time = time.perf_counter() - start
+        stats.nodes = self.nodes
+        stats.cutoffs = self.cutoffs
+        stats.researches = self.researches
+        stats.depth = self.depth
+        table = self.transposition_table
+        if table is not None:
+            stats.tt_hits = table.hits - hits
+            stats.tt_probes = stats.tt_hits + table.misses - misses
+
+    def search(self, game, player, depth):
+        """
+        Fixed-depth search
+        :return: (score for `player`, best move)
+        """
+        self.new_search(game)
+        self.depth = depth
+        score = self.search_root(self._instrument(game), player, depth)
+        self.finish_stats()
+        return score, self.best_move
+
+    def iterative_deepening(self, game, player, time_limit_ms, max_depth=None):
+        """
+        Search depth 1, 2, 3, ... until the time budget runs out
+        :return: (score for `player`, best move) of the deepest iteration that finished in time
+        """
+        deadline = time.perf_counter() + time_limit_ms / 1000
+        self.new_search(game)
+        best = None
+        # a timeout unwinds the search without undoing its moves, so search on a copy of the game
+        game = self._instrument(game.copy())
+        # the game cannot last longer than the number of empty squares
+        max_depth = min(max_depth or game.num_empty_squares(), game.num_empty_squares())
+        for depth in range(1, max_depth + 1):
+            # the first iteration always runs to completion so that there is a move to play
+            self._deadline = deadline if best is not None else None
+            try:
+                score = self._aspiration_search(game, player, depth, best[0] if best is not None else None)
+            except SearchTimeout:
+                break
+            finally:
+                self._deadline = None
+            best = score, self.best_move
+            self.depth = depth
+            self._pv_moves = self.principal_variation(game, player, self.best_move, depth)
+            if time.perf_counter() >= deadline:
+                break
+        self.finish_stats()
+        return best
+
+    def _aspiration_search(self, game, player, depth, guess):
+        if guess is None or self.aspiration_window is None:
+            return self.search_root(game, player, depth)
+        alpha, beta = guess - self.aspiration_window, guess + self.aspiration_window
+        score = self.search_root(game, player, depth, alpha, beta)
+        if score <= alpha or score >= beta:
+            # the score is only a bound outside the window, so the best move may be wrong
+            self.researches += 1
+            score = self.search_root(game, player, depth)
+        return score
+
+    def principal_variation(self, game, player, first_move, depth):
+        """
+        Follow the best moves stored in the transposition table from the current position
+        :return: dict of position hash -> best move for each position along the principal variation
+        """
+        pv_moves = {game.position_hash: first_move}
+        if self.transposition_table is None:
+            return pv_moves
+        played = []
+        move = first_move
+        while move is not None and len(played) < depth - 1:
+            game.make_move(move, player)
+            played.append(move)
+            if game.game_over():
+                break
+            player = OTHER_LETTER[player]
+            entry = self.transposition_table.probe(self._key(game, player))
+            move = entry.move if entry is not None else None
+            if move is not None:
+                pv_moves[game.position_hash] = move
+        for move in reversed(played):
+            game.undo_move(move)
+        return pv_moves
+
+    @staticmethod
+    def _key(game, player):
+        return game.position_hash ^ SIDE_TO_MOVE_KEY if player == 'O' else game.position_hash
+
+    def order_moves(self, game, moves, player, depth, ply, entry=None):
+        """
+        :param entry: the transposition table entry of the position, if any
+        :return: the moves in the order the search tries them
+        """
+        # the principal variation of the previous iteration goes before everything else,
+        # then the best move found last time for this position
+        hash_move = self._pv_moves.get(game.position_hash)
+        if hash_move is None and entry is not None:
+            hash_move = entry.move
+        if self.move_orderer is not None:
+            urgent = game.winning_moves(player) + game.winning_moves(OTHER_LETTER[player]) \
+                if self._urgent_moves and depth > 1 else ()
+            return self.move_orderer.order(moves, ply, player, hash_move, urgent)
+        if hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+        return moves
+
+    def root_moves(self, game, player, depth):
+        """
+        The moves of the current position in the order a search of `depth` would try them, for root splitting
+        """
+        self._urgent_moves = hasattr(game, 'winning_moves')
+        entry = None
+        if self.transposition_table is not None:
+            entry = self.transposition_table.probe(self._key(game, player))
+        return self.order_moves(game, game.available_moves(), player, depth, 0, entry)
+
+    def score_move(self, game, player, move, depth, alpha=-INFINITY, beta=INFINITY, pruning=True):
+        """
+        Score one move of the current position with a search of `depth` plies, the move being the first,
+        as the root search does for each of its moves
+        :param alpha: a score at or below it is only an upper bound
+        :param beta: a score at or above it is only a lower bound
+        :param pruning: use the alpha-beta search, or plain minimax
+        :return: the score for `player`
+        """
+        opponent = OTHER_LETTER[player]
+        game.make_move(move, player)
+        try:
+            if pruning:
+                return -self.negamax(game, opponent, depth - 1, -beta, -alpha, 1)
+            return -self.minimax(game, opponent, depth - 1, 1)
+        finally:
+            game.undo_move(move)
+
+    @staticmethod
+    def move_ranks(game):
+        """The index of every move in the game's order, which breaks ties between root moves"""
+        return {move: index for index, move in enumerate(game.available_moves())}
+
+    def search_root(self, game, player, depth, alpha=-INFINITY, beta=INFINITY):
+        """
+        Alpha-beta search of the root, which leaves the best move in self.best_move.
+        Of the moves with the best score, the first in the game's order is chosen, like plain minimax does,
+        so the move does not depend on the order the moves were searched in.
+        :return: the score of the position for `player`
+        """
+        self.nodes += 1
+        moves = self.root_moves(game, player, depth)
+        ranks = self.move_ranks(game)
+        alpha_orig = alpha
+        best_score = -INFINITY
+        best_move = None
+        for index, move in enumerate(moves):
+            floor = alpha
+            if best_move is not None and ranks[move] < ranks[best_move]:
+                # this move wins a tie, so its search has to tell a tie from a worse score
+                floor -= 1
+            if index == 0 or not self.pvs:
+                score = self.score_move(game, player, move, depth, floor, beta)
+            else:
+                score = self.score_move(game, player, move, depth, floor, floor + 1)
+                if floor < score < beta:
+                    self.researches += 1
+                    score = self.score_move(game, player, move, depth, score, beta)
+            if score > best_score or score == best_score and ranks[move] < ranks[best_move]:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if index == 0:
+                            self.first_move_cutoffs += 1
+                        if self.stats is not None:
+                            self.stats.add_cutoff(index)
+                        if self.move_orderer is not None:
+                            self.move_orderer.cutoff(move, 0, player, depth)
+                        break
+
+        if self.transposition_table is not None:
+            if best_score <= alpha_orig:
+                flag = UPPER_BOUND
+            elif best_score >= beta:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT
+            self.transposition_table.store(self._key(game, player), depth, flag, best_score, best_move)
+        self.best_move = best_move
+        return best_score
+
+    def negamax(self, game, player, depth, alpha, beta, ply):
+        """
+        :return: the score of the position for `player`, the player to move
+        """
+        self.nodes += 1
+        if depth == 0 or game.game_over():
+            return game.evaluate(player)
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout
+
+        table = self.transposition_table
+        moves = game.available_moves()
+        entry = None
+        if table is not None:
+            key = self._key(game, player)
+            entry = table.probe(key)
+            if entry is not None and entry.depth >= depth:
+                if entry.flag == EXACT:
+                    return entry.score
+                if entry.flag == LOWER_BOUND:
+                    alpha = max(alpha, entry.score)
+                else:
+                    beta = min(beta, entry.score)
+                if alpha >= beta:
+                    return entry.score
+
+        moves = self.order_moves(game, moves, player, depth, ply, entry)
+        opponent = OTHER_LETTER[player]
+        orderer = self.move_orderer
+        alpha_orig = alpha
+        best_score = -INFINITY
+        best_move = None
+        leaf_scores = depth == 1 and self._leaf_scores
+        for index, move in enumerate(moves):
+            if leaf_scores:
+                # the children are leaves: score them without playing the move
+                self.nodes += 1
+                score = game.evaluate_after_move(move, player, player)
+            else:
+                game.make_move(move, player)
+                if index == 0 or not self.pvs:
+                    score = -self.negamax(game, opponent, depth - 1, -beta, -alpha, ply + 1)
+                else:
+                    score = -self.negamax(game, opponent, depth - 1, -alpha - 1, -alpha, ply + 1)
+                    if alpha < score < beta:
+                        self.researches += 1
+                        score = -self.negamax(game, opponent, depth - 1, -beta, -score, ply + 1)
+                game.undo_move(move)
+
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if index == 0:
+                            self.first_move_cutoffs += 1
+                        if self.stats is not None:
+                            self.stats.add_cutoff(index)
+                        if orderer is not None:
+                            orderer.cutoff(move, ply, player, depth)
+                        break
+
+        if table is not None:
+            if best_score <= alpha_orig:
+                flag = UPPER_BOUND
+            elif best_score >= beta:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT
+            table.store(key, depth, flag, best_score, best_move)
+        return best_score
+
+    def minimax(self, game, player, depth, ply=0):
+        """
+        Plain negamax without pruning or tables, which visits the whole tree
+        :return: the score of the position for `player`; at ply 0 the best move is left in self.best_move
+        """
+        self.nodes += 1
+        if depth == 0 or game.game_over():
+            return game.evaluate(player)
+        opponent = OTHER_LETTER[player]
+        best_score = -INFINITY
+        best_move = None
+        for move in game.available_moves():
+            game.make_move(move, player)
+            score = -self.minimax(game, opponent, depth - 1, ply + 1)
+            game.undo_move(move)
+            if score > best_score:
+                best_score, best_move = score, move
+        if ply == 0:
+            self.best_move = best_move
+        return best_score
+
+    def search_without_pruning(self, game, player, depth):
+        """
+        :return: (score for `player`, best move) of the plain minimax search
+        """
+        self.new_search(game)
+        self.depth = depth
+        score = self.minimax(self._instrument(game), player, depth)
+        self.finish_stats()
+        return score, self.best_move
@@ -0,0 +1,176 @@
+"""
+This file is for the statistics of the MiniMax players' searches
+A SearchStats Class
+A InstrumentedGame Class
+
+A SearchEngine created with collect_stats=True fills a SearchStats for every search, and the MiniMax players
+keep the one of their last move in last_stats. Nothing is collected otherwise: the engine only checks for a
+stats object where a node is cut off.
+The counters that need the game (leaf evaluations, the deepest ply reached, the time spent evaluating and
+checking for the end of the game) come from an InstrumentedGame the engine searches instead of the game.
+
+Stats add up with merge(), e.g. over every move of a benchmark run, and to_dict() is plain JSON.
+"""
+import json
+import time
+
+# the fields of to_dict(), besides the derived ones
+COUNTERS = ('moves', 'nodes', 'leaf_evaluations', 'cutoffs', 'researches', 'tt_probes', 'tt_hits', 'depth',
+            'max_depth', 'evaluate_time', 'game_over_time', 'time')
+
+
+class SearchStats:
+    """
+    Statistics of one search, or the sum of several
+    """
+
+    def __init__(self, source='search'):
+        """
+        :param source: what chose the move: 'search', or 'book', 'solver' or 'table' for a move that was
+                       looked up or solved instead
+        """
+        self.source = source
+        self.moves = 1  # number of moves added up
+        self.nodes = 0
+        self.leaf_evaluations = 0  # calls of evaluate and evaluate_after_move
+        self.cutoffs = 0
+        self.cutoffs_by_index = []  # cutoffs by the index of the cutting move in the node's move order
+        self.researches = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.depth = 0  # the nominal depth of the search, the deepest for iterative deepening
+        self.max_depth = 0  # the deepest ply a move was made or evaluated at
+        self.evaluate_time = 0.0  # seconds in evaluate and evaluate_after_move
+        self.game_over_time = 0.0  # seconds in game_over, which checks for a winner
+        self.time = 0.0  # seconds of the whole move
+
+    def add_cutoff(self, index, count=1):
+        counts = self.cutoffs_by_index
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += count
+
+    @property
+    def effective_branching_factor(self):
+        """The branching factor of a uniform tree of the search's depth with as many nodes as were searched"""
+        if self.depth == 0 or self.nodes == 0:
+            return 0.0
+        return (self.nodes / self.moves) ** (1 / (self.depth / self.moves))
+
+    @property
+    def first_move_cutoff_rate(self):
+        """The share of the cutoffs made by the first move searched, a measure of the ordering quality"""
+        if not self.cutoffs_by_index:
+            return 0.0
+        return self.cutoffs_by_index[0] / sum(self.cutoffs_by_index)
+
+    def merge(self, other):
+        """Add the stats of other moves to these"""
+        if other.source != self.source:
+            self.source = 'mixed'
+        for name in COUNTERS:
+            if name == 'max_depth':
+                self.max_depth = max(self.max_depth, other.max_depth)
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+        for index, count in enumerate(other.cutoffs_by_index):
+            self.add_cutoff(index, count)
+        return self
+
+    @classmethod
+    def total(cls, stats):
+        """:return: the sum of some stats, or None if there are none"""
+        result = None
+        for item in stats:
+            if result is None:
+                result = cls(item.source)
+                result.moves = 0
+            result.merge(item)
+        return result
+
+    def to_dict(self):
+        result = {'source': self.source}
+        for name in COUNTERS:
+            result[name] = getattr(self, name)
+        result['cutoffs_by_index'] = list(self.cutoffs_by_index)
+        result['effective_branching_factor'] = self.effective_branching_factor
+        result['first_move_cutoff_rate'] = self.first_move_cutoff_rate
+        return result
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['source'])
+        for name in COUNTERS:
+            setattr(stats, name, data[name])
+        stats.cutoffs_by_index = list(data['cutoffs_by_index'])
+        return stats
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+
+def save_stats(stats, filename):
+    """
+    Write stats to a JSON file
+    :param stats: {name: SearchStats}, e.g. the total of each player
+    """
+    with open(filename, 'w') as f:
+        json.dump({name: item.to_dict() for name, item in stats.items()}, f, indent=2)
+
+
+class InstrumentedGame:
+    """
+    Wraps a game for the search: counts and times evaluations and end-of-game checks, and follows the ply
+    of the search through make_move and undo_move. Everything else goes to the game.
+    """
+
+    def __init__(self, game, stats):
+        self._game = game
+        self._stats = stats
+        self._ply = 0
+        # the methods the search calls at every node skip __getattr__
+        self.available_moves = game.available_moves
+        if hasattr(game, 'winning_moves'):
+            self.winning_moves = game.winning_moves
+
+    def __getattr__(self, name):
+        return getattr(self._game, name)
+
+    @property
+    def position_hash(self):
+        return self._game.position_hash
+
+    def make_move(self, move, letter):
+        self._ply += 1
+        if self._ply > self._stats.max_depth:
+            self._stats.max_depth = self._ply
+        return self._game.make_move(move, letter)
+
+    def undo_move(self, move):
+        self._ply -= 1
+        return self._game.undo_move(move)
+
+    def game_over(self):
+        start = time.perf_counter()
+        result = self._game.game_over()
+        self._stats.game_over_time += time.perf_counter() - start
+        return result
+
+    def evaluate(self, player):
+        stats = self._stats
+        start = time.perf_counter()
+        score = self._game.evaluate(player)
+        stats.evaluate_time += time.perf_counter() - start
+        stats.leaf_evaluations += 1
+        return score
+
+    def evaluate_after_move(self, move, letter, player):
+        stats = self._stats
+        start = time.perf_counter()
+        score = self._game.evaluate_after_move(move, letter, player)
+        stats.evaluate_time += time.perf_counter() - start
+        stats.leaf_evaluations += 1
+        # the move is scored without being made, one ply deeper
+        if self._ply + 1 > stats.max_depth:
+            stats.max_depth = self._ply + 1
+        return score
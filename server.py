@@ -0,0 +1,325 @@
+"""
+This file is for hosting many games at once over TCP or a Unix socket
+A Session Class
+A GameServer Class
+
+A client plays against a computer player. The protocol is line-delimited JSON: every request is one JSON
+object on one line, and the server answers each with one line. A connection can hold any number of sessions.
+    {"op": "new", "game": "ttt" | "connect4",
+     "opponent": "Random" | "SmartRandom" | "Q-learning" | "Minimax" | "MCTS",
+     "letter": "X" | "O", "depth": n}     start a session; the client plays `letter` ('X' by default),
+                                          depth is the search depth of the Connect4 Minimax player,
+                                          at most MAX_DEPTH
+    {"op": "move", "session": id, "move": n}    play a square or column, the opponent answers right away
+    {"op": "state", "session": id}
+    {"op": "close", "session": id}
+The answer is the state of the session:
+    {"session": id, "game": ..., "board": ..., "letter": the client's letter, "turn": letter to move,
+     "moves": legal moves, "last_move": the opponent's last move, "over": bool, "winner": letter or null}
+or {"error": message}. A request's "id", if any, is copied into the answer: requests are handled
+concurrently, so the answers of different sessions can come back in another order than the requests.
+
+Minimax, MCTS and Q-learning moves are computed in an executor (a process pool by default), so a deep search
+never holds up the other sessions. Each worker keeps one player per kind and game, which all sessions share:
+a Q-table is memory-mapped once per worker (and shared between workers by the OS page cache), and the search
+players keep their transposition tables between sessions.
+Random players move on the event loop, since their moves cost less than sending them to a worker.
+
+Run `python server.py <port | unix socket path> [workers]` from the project root.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from consts import CONNECT4, CONNECT4_Q_TABLE_PATH, GAMES, MCTS, MINIMAX, Q_LEARNING, RANDOM, SMART_RANDOM, \
+    TIC_TAC_TOE, TTT_Q_TABLE_PATH
+
+OPPONENTS = [RANDOM, SMART_RANDOM, Q_LEARNING, MINIMAX, MCTS]
+Q_TABLE_PATHS = {TIC_TAC_TOE: TTT_Q_TABLE_PATH, CONNECT4: CONNECT4_Q_TABLE_PATH}
+# requests are read line by line, and no valid request comes close to this
+MAX_LINE = 1 << 16
+# deepest search a client can ask for: deeper searches would hold up a worker for seconds per move, and every
+# depth gets its own cached player with its own transposition table in every worker
+MAX_DEPTH = 8
+
+
+def _game_class(game_name):
+    if game_name == TIC_TAC_TOE:
+        from tictactoe.game import TicTacToe
+        return TicTacToe
+    from connect4.game import Connect4
+    return Connect4
+
+
+def _player_module(game_name):
+    if game_name == TIC_TAC_TOE:
+        import tictactoe.player as module
+    else:
+        import connect4.player as module
+    return module
+
+
+def new_player(game_name, opponent, depth=None):
+    """
+    A computer player of the server
+    :raise FileNotFoundError: for a Q-learning player whose Q-table has not been trained
+    """
+    module = _player_module(game_name)
+    if opponent == RANDOM:
+        return module.RandomComputerPlayer('')
+    if opponent == SMART_RANDOM:
+        return module.SmartRandomComputerPlayer('')
+    if opponent == Q_LEARNING:
+        player = module.QLearningPlayer('')
+        # outside training mode the table is memory-mapped read-only
+        player.load_q_table(Q_TABLE_PATHS[game_name])
+        return player
+    if opponent == MCTS:
+        return module.MCTSPlayer('')
+    if game_name == CONNECT4:
+        # clients play for real, so endgames are solved exactly
+        if depth is not None:
+            return module.MiniMaxPlayer('', depth=depth, solve_below=module.SOLVE_BELOW)
+        return module.MiniMaxPlayer('', solve_below=module.SOLVE_BELOW)
+    return module.MiniMaxPlayer('')
+
+
+# the players of an executor worker, by (game, opponent, depth); per thread, since a search is not thread-safe
+_worker_players = threading.local()
+
+
+def player_move(game_name, opponent, depth, game, letter):
+    """The move of a computer player, run in the executor"""
+    players = getattr(_worker_players, 'players', None)
+    if players is None:
+        players = _worker_players.players = {}
+    key = (game_name, opponent, depth)
+    player = players.get(key)
+    if player is None:
+        player = players[key] = new_player(game_name, opponent, depth)
+    player.letter = letter
+    if opponent == Q_LEARNING:
+        # get_move would keep a history of the states for training, which is never used here
+        return player.choose_best_move(player.get_state(game), game.available_moves())
+    return player.get_move(game)
+
+
+class Session:
+    def __init__(self, session_id, game_name, opponent, letter, depth=None):
+        self.session_id = session_id
+        self.game_name = game_name
+        self.opponent = opponent
+        self.letter = letter  # the client's letter
+        self.depth = depth
+        self.game = _game_class(game_name)()
+        self.turn = 'X'
+        self.last_move = None
+        # one request of a session at a time, while the other sessions go on
+        self.lock = asyncio.Lock()
+        # random players are cheap enough to move on the event loop
+        self.local_player = new_player(game_name, opponent) if opponent in (RANDOM, SMART_RANDOM) else None
+
+    def play(self, move, letter):
+        """:raise ValueError: if the move is not legal"""
+        if self.game.game_over():
+            raise ValueError("The game is over")
+        if not isinstance(move, int) or isinstance(move, bool) or move not in self.game.available_moves():
+            raise ValueError(f"Invalid move: {move!r}")
+        self.game.make_move(move, letter)
+        self.turn = 'O' if letter == 'X' else 'X'
+
+    def state(self):
+        game = self.game
+        return {'session': self.session_id, 'game': self.game_name, 'board': game.board, 'letter': self.letter,
+                'turn': self.turn, 'moves': [] if game.game_over() else game.available_moves(),
+                'last_move': self.last_move, 'over': game.game_over(), 'winner': game.current_winner}
+
+
+class GameServer:
+    """
+    Hosts the sessions of all connections. Sessions belong to the connection that started them and are
+    dropped when it closes.
+    """
+
+    def __init__(self, workers=None, executor=None):
+        """
+        :param workers: number of worker processes of the default executor, os.cpu_count() if None
+        :param executor: a concurrent.futures executor for the computer players' moves, instead of a process pool
+        """
+        self.executor = executor if executor is not None else ProcessPoolExecutor(workers)
+        self.sessions = {}
+        self._next_session = 1
+
+    async def start_tcp(self, host='127.0.0.1', port=8765):
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE)
+
+    async def start_unix(self, path):
+        return await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_LINE)
+
+    async def handle_connection(self, reader, writer):
+        owned = set()
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def answer(line):
+            reply = await self.handle_line(line, owned)
+            async with write_lock:
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # the line was longer than MAX_LINE
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for session_id in owned:
+                self.sessions.pop(session_id, None)
+            writer.close()
+
+    async def handle_line(self, line, owned):
+        """
+        :param owned: the ids of the sessions of the connection
+        :return: the answer to one request line
+        """
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request must be a JSON object")
+            request_id = request.get('id')
+            reply = await self.handle_request(request, owned)
+        except (ValueError, KeyError, TypeError, FileNotFoundError) as e:
+            reply = {'error': str(e)}
+        except Exception as e:
+            # e.g. a broken process pool or a bug in a player: the client still gets an answer
+            reply = {'error': f"{e.__class__.__name__}: {e}"}
+        if request_id is not None:
+            reply['id'] = request_id
+        return reply
+
+    async def handle_request(self, request, owned):
+        op = request.get('op')
+        if op == 'new':
+            return await self.new_session(request, owned)
+        session = self._session(request, owned)
+        async with session.lock:
+            if op == 'move':
+                if session.turn != session.letter:
+                    raise ValueError("It is not your turn")
+                session.play(request['move'], session.letter)
+                await self._computer_move(session)
+            elif op == 'close':
+                owned.discard(session.session_id)
+                self.sessions.pop(session.session_id, None)
+            elif op != 'state':
+                raise ValueError(f"Unknown op: {op!r}")
+            return session.state()
+
+    async def new_session(self, request, owned):
+        game_name = request.get('game')
+        opponent = request.get('opponent', MINIMAX)
+        letter = request.get('letter', 'X')
+        depth = request.get('depth')
+        if game_name not in GAMES:
+            raise ValueError(f"Game must be one of {GAMES}")
+        if opponent not in OPPONENTS:
+            raise ValueError(f"Opponent must be one of {OPPONENTS}")
+        if letter not in ('X', 'O'):
+            raise ValueError("Letter must be 'X' or 'O'")
+        if depth is not None and (not isinstance(depth, int) or isinstance(depth, bool) or
+                                  not 1 <= depth <= MAX_DEPTH):
+            raise ValueError(f"Depth must be an integer from 1 to {MAX_DEPTH}")
+        if game_name != CONNECT4 or opponent != MINIMAX:
+            # only the Connect4 Minimax player has a depth, so the other players are shared whatever it is
+            depth = None
+        if opponent == Q_LEARNING and not os.path.exists(Q_TABLE_PATHS[game_name]):
+            raise FileNotFoundError(f"The Q-table of {game_name} has not been trained")
+        session = Session(self._next_session, game_name, opponent, letter, depth)
+        self._next_session += 1
+        self.sessions[session.session_id] = session
+        owned.add(session.session_id)
+        async with session.lock:
+            if letter == 'O':
+                try:
+                    await self._computer_move(session)
+                except BaseException:
+                    # a session whose first move failed would wait for the computer forever
+                    owned.discard(session.session_id)
+                    self.sessions.pop(session.session_id, None)
+                    raise
+            return session.state()
+
+    def _session(self, request, owned):
+        session_id = request.get('session')
+        # a connection only sees its own sessions
+        if session_id not in owned or session_id not in self.sessions:
+            raise ValueError(f"Unknown session: {session_id!r}")
+        return self.sessions[session_id]
+
+    async def _computer_move(self, session):
+        if session.game.game_over():
+            return
+        letter = session.turn
+        if session.local_player is not None:
+            session.local_player.letter = letter
+            move = session.local_player.get_move(session.game)
+        else:
+            loop = asyncio.get_running_loop()
+            # the worker gets a copy of the game, so the session's game is never touched by two threads
+            move = await loop.run_in_executor(self.executor, player_move, session.game_name, session.opponent,
+                                              session.depth, session.game.copy(), letter)
+        session.play(move, letter)
+        session.last_move = move
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def serve(address, workers=None):
+    """
+    Serve until cancelled
+    :param address: a TCP port, or the path of a Unix socket
+    """
+    server = GameServer(workers)
+    if isinstance(address, int):
+        listener = await server.start_tcp(port=address)
+    else:
+        listener = await server.start_unix(address)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        raise ValueError("Usage: python server.py <port | unix socket path> [workers]")
+    address = int(sys.argv[1]) if sys.argv[1].isdigit() else sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    print("Serving on", address)
+    try:
+        asyncio.run(serve(address, workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,103 @@
+from functools import lru_cache
+
+# Squares are numbered 0-8 row by row; bit i of a mask is square i
+FULL_BOARD = 0b111111111
+WIN_LINES = (
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100,  # diagonals
+)
+# the winning lines that go through each square
+SQUARE_LINES = tuple(tuple(line for line in WIN_LINES if line >> square & 1) for square in range(9))
+# base-3 digit of each letter in the integer state id
+LETTER_DIGITS = {' ': 0, 'X': 1, 'O': 2}
+POWERS_OF_3 = tuple(3 ** square for square in range(9))
+
+
+def _winning_squares(mask, occupied):
+    """The empty squares that would complete a line for the squares of `mask`, as a mask"""
+    squares = 0
+    for line in WIN_LINES:
+        missing = line & ~mask
+        # exactly one square of the line is missing
+        if missing and not missing & (missing - 1):
+            squares |= missing
+    return squares & ~occupied
+
+
+def _rotate(square):
+    row, col = divmod(square, 3)
+    return col * 3 + 2 - row
+
+
+def _reflect(square):
+    row, col = divmod(square, 3)
+    return row * 3 + 2 - col
+
+
+# The 8 symmetries of the board (4 rotations, each with and without a reflection) as square permutations:
+# SYMMETRIES[i][square] is the square that `square` is moved to
+_ROTATIONS = [tuple(range(9))]
+for _ in range(3):
+    _ROTATIONS.append(tuple(_rotate(square) for square in _ROTATIONS[-1]))
+SYMMETRIES = tuple(_ROTATIONS + [tuple(_reflect(square) for square in rotation) for rotation in _ROTATIONS])
+
+
+@lru_cache(maxsize=None)
+def canonical_state(state_id):
+    """
+    Pick one representative for the 8 symmetric versions of a board
+    :return: (the smallest state id among them, a tuple mapping each square to the matching square there)
+    """
+    digits = [state_id // power % 3 for power in POWERS_OF_3]
+    best_id, best_permutations = None, []
+    for permutation in SYMMETRIES:
+        transformed = sum(digit * POWERS_OF_3[permutation[square]] for square, digit in enumerate(digits))
+        if best_id is None or transformed < best_id:
+            best_id, best_permutations = transformed, [permutation]
+        elif transformed == best_id:
+            best_permutations.append(permutation)
+    # on a symmetric board several symmetries give the same representative; squares that they swap are
+    # equivalent moves, so each square goes to the smallest of its images to share one Q-table entry
+    return best_id, tuple(min(permutation[square] for permutation in best_permutations) for square in range(9))
+
+
+def board_to_state_id(board):
+    """
+    Encode a 9-cell board of 'X', 'O' and ' ' as a base-3 integer (square i is the i-th digit)
+    """
+    return sum(LETTER_DIGITS[spot] * POWERS_OF_3[square] for square, spot in enumerate(board))
+
+
 class TicTacToe:
+    """
+    Tic-tac-toe board stored as one 9-bit mask per letter.
+    state_id is the base-3 encoding of the board and is kept up to date on every move.
+    """
+
     def __init__(self):
-        self.board = [' ' for _ in range(9)]
+        self.masks = {'X': 0, 'O': 0}
+        self.state_id = 0
         self.current_winner = None
 
+    def reset(self):
+        self.masks = {'X': 0, 'O': 0}
+        self.state_id = 0
+        self.current_winner = None
+
+    @property
+    def board(self):
+        """
+        The 9 squares as 'X', 'O' or ' ', rebuilt from the masks.
+        It is a read-only view: use make_move and undo_move to change the position.
+        """
+        x_mask = self.masks['X']
+        o_mask = self.masks['O']
+        return ['X' if x_mask >> i & 1 else 'O' if o_mask >> i & 1 else ' ' for i in range(9)]
+
     def print_board(self):
-        for row in [self.board[i * 3:(i + 1) * 3] for i in range(3)]:
+        board = self.board
+        for row in [board[i * 3:(i + 1) * 3] for i in range(3)]:
             print('| ' + ' | '.join(row) + ' |')
 
     @staticmethod
@@ -14,49 +107,89 @@ class TicTacToe:
             print('| ' + ' | '.join(row) + ' |')
 
     def available_moves(self):
-        return [i for i, spot in enumerate(self.board) if spot == ' ']
+        occupied = self.masks['X'] | self.masks['O']
+        return [i for i in range(9) if not occupied >> i & 1]
 
     def empty_squares(self):
-        return ' ' in self.board
+        return self.masks['X'] | self.masks['O'] != FULL_BOARD
 
     def num_empty_squares(self):
-        return self.board.count(' ')
+        return 9 - (self.masks['X'] | self.masks['O']).bit_count()
 
     def make_move(self, square, letter):
-        if self.board[square] == ' ':
-            self.board[square] = letter
-            if self.winner(square, letter):
-                self.current_winner = letter
-            return True
+        bit = 1 << square
+        if (self.masks['X'] | self.masks['O']) & bit:
+            return False
+        self.masks[letter] |= bit
+        self.state_id += LETTER_DIGITS[letter] * POWERS_OF_3[square]
+        if self.winner(square, letter):
+            self.current_winner = letter
+        return True
+
+    def undo_move(self, square):
+        bit = 1 << square
+        for letter, mask in self.masks.items():
+            if mask & bit:
+                self.masks[letter] = mask ^ bit
+                self.state_id -= LETTER_DIGITS[letter] * POWERS_OF_3[square]
+                if self.current_winner == letter and not any(self.masks[letter] & line == line for line in WIN_LINES):
+                    self.current_winner = None
+                return True
         return False
 
     def winner(self, square, letter):
-        # check the row
-        row_ind = square // 3
-        row = self.board[row_ind * 3:(row_ind + 1) * 3]
-        if all([spot == letter for spot in row]):
-            return True
-        # check column
-        col_ind = square % 3
-        column = [self.board[col_ind + i * 3] for i in range(3)]
-        if all([spot == letter for spot in column]):
-            return True
-        # check diagonals
-        # only if the square is an even number (0, 2, 4, 6, 8)
-        # these are the only moves possible to win a diagonal
-        if square % 2 == 0:
-            diagonal1 = [self.board[i] for i in [0, 4, 8]]
-            if all([spot == letter for spot in diagonal1]):
-                return True
-            diagonal2 = [self.board[i] for i in [2, 4, 6]]
-            if all([spot == letter for spot in diagonal2]):
+        # only the lines through the square just played can have been completed
+        mask = self.masks[letter]
+        for line in SQUARE_LINES[square]:
+            if mask & line == line:
                 return True
-        # if all of these checks fail
         return False
 
+    def playout(self, letter, rng):
+        """
+        Play the game out from this position with `letter` to move, on copies of the masks, for MCTS:
+        every move wins on the spot if it can, blocks a win of the opponent on the spot if it must, and
+        goes to a random empty square otherwise. The game is not changed.
+        :param rng: a random.Random
+        :return: the winner, or None for a tie
+        """
+        if self.current_winner is not None:
+            return self.current_winner
+        other = 'O' if letter == 'X' else 'X'
+        mine, theirs = self.masks[letter], self.masks[other]
+        while mine | theirs != FULL_BOARD:
+            occupied = mine | theirs
+            if _winning_squares(mine, occupied):
+                return letter
+            square = _winning_squares(theirs, occupied)
+            if square:
+                square &= -square
+            else:
+                empty = [1 << i for i in range(9) if not occupied >> i & 1]
+                square = empty[int(rng.random() * len(empty))]
+            mine, theirs = theirs, mine | square
+            letter, other = other, letter
+        return None
+
+    @property
+    def position_hash(self):
+        """The hash of the position for the search engine (see search.py): the state id, which is unique"""
+        return self.state_id
+
+    def evaluate(self, player):
+        """
+        Score a finished game for `player`: a win is worth the number of empty squares + 1, so that faster
+        wins score higher, a draw and an unfinished game are worth 0
+        """
+        if self.current_winner is None:
+            return 0
+        score = self.num_empty_squares() + 1
+        return score if self.current_winner == player else -score
+
     def copy(self):
         new_board = TicTacToe()
-        new_board.board = self.board.copy()
+        new_board.masks = self.masks.copy()
+        new_board.state_id = self.state_id
         new_board.current_winner = self.current_winner
         return new_board
 
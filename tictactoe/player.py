@@ -1,4 +1,14 @@
 import random
+import time
+
+from consts import TTT_SOLVED_TABLE_PATH
+from mcts import DEFAULT_ITERATIONS, EXPLORATION, MonteCarloTreeSearch
+from qtable import FLAG_CANONICAL, MappedQTable, is_binary_q_table, load_binary_q_table, read_flags, \
+    save_binary_q_table
+from search import SearchEngine
+from search_stats import SearchStats
+from .game import LETTER_DIGITS, POWERS_OF_3, SYMMETRIES, board_to_state_id, canonical_state
+from .solver import NO_MOVE, load_solved_table
 
 
 def other_letter(letter):
@@ -21,6 +31,12 @@ class RandomComputerPlayer(Player):
         square = random.choice(game.available_moves())
         return square
 
+    def get_moves(self, vec_game):
+        """
+        A random move for every game of a vectorized game (see vec_env.py)
+        """
+        return vec_game.random_moves()
+
 
 class SmartRandomComputerPlayer(Player):
     """
@@ -52,85 +68,57 @@ class SmartRandomComputerPlayer(Player):
 
 
 class MiniMaxPlayer(Player):
-    def __init__(self, letter, pruning=True):
+    """
+    Perfect-play minimax player.
+    Moves are looked up in the solved table built by tictactoe/solver.py;
+    the player only searches (with search.SearchEngine, to the end of the game) if the table has not been built.
+    Of the squares with the best score, the search picks the lowest one, so that it picks the same move as
+    the table.
+    With collect_stats, last_stats holds the search_stats.SearchStats of the last move.
+    """
+
+    def __init__(self, letter, pruning=True, solved_table_path=TTT_SOLVED_TABLE_PATH, tt_size=0,
+                 collect_stats=False):
         super().__init__(letter)
         self.pruning = pruning
+        self.engine = SearchEngine(tt_size, collect_stats=collect_stats)
+        self.collect_stats = collect_stats
+        self.last_stats = None
+        self.solved_moves = None
+        if solved_table_path is not None:
+            try:
+                self.solved_moves, _ = load_solved_table(solved_table_path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def nodes(self):
+        """nodes searched for the last move"""
+        return self.engine.nodes
 
     def get_move(self, game):
-        if len(game.available_moves()) == 9:
-            random.choice(game.available_moves())
+        self.engine.nodes = 0
+        start = time.perf_counter() if self.collect_stats else None
+        # the table is solved for the player to move, and X always moves first
+        x_to_move = game.masks['X'].bit_count() == game.masks['O'].bit_count()
+        if self.solved_moves is not None and (self.letter == 'X') == x_to_move:
+            move = self.solved_moves[game.state_id]
+            if move != NO_MOVE:
+                self._lookup_stats('table', start)
+                return move
+        depth = game.num_empty_squares()
         if self.pruning:
-            return self.minimax_with_alpha_beta_pruning(game, self.letter, -float('inf'), float('inf'))['position']
+            move = self.engine.search(game, self.letter, depth)[1]
         else:
-            return self.minimax(game, self.letter)['position']
+            move = self.engine.search_without_pruning(game, self.letter, depth)[1]
+        self.last_stats = self.engine.stats
+        return move
 
-    def minimax(self, state, player):
-        max_player = self.letter
-        other_player = other_letter(player)
-
-        if state.current_winner == other_player:
-            return {'position': None,
-                    'score': 1 * (state.num_empty_squares() + 1) if other_player == max_player else -1 * (
-                            state.num_empty_squares() + 1)}
-        elif not state.empty_squares():
-            return {'position': None, 'score': 0}
-
-        if player == max_player:
-            best = {'position': None, 'score': -float('inf')}
-        else:
-            best = {'position': None, 'score': float('inf')}
-
-        for possible_move in state.available_moves():
-            state.make_move(possible_move, player)
-            sim_score = self.minimax(state, other_player)  # alternate players
-            state.board[possible_move] = ' '
-            state.current_winner = None
-            sim_score['position'] = possible_move
-
-            if player == max_player:  # max
-                if sim_score['score'] > best['score']:
-                    best = sim_score
-            else:  # min
-                if sim_score['score'] < best['score']:
-                    best = sim_score
-        return best
-
-    def minimax_with_alpha_beta_pruning(self, state, player, alpha, beta):
-        max_player = self.letter
-        other_player = other_letter(player)
-
-        if state.current_winner == other_player:
-            return {'position': None,
-                    'score': 1 * (state.num_empty_squares() + 1) if other_player == max_player else -1 * (
-                            state.num_empty_squares() + 1)}
-        elif not state.empty_squares():
-            return {'position': None, 'score': 0}
-
-        if player == max_player:
-            best = {'position': None, 'score': -float('inf')}
-        else:
-            best = {'position': None, 'score': float('inf')}
-
-        for possible_move in state.available_moves():
-            state.make_move(possible_move, player)
-            sim_score = self.minimax_with_alpha_beta_pruning(state, other_player, alpha, beta)
-            state.board[possible_move] = ' '
-            state.current_winner = None
-            sim_score['position'] = possible_move
-
-            if player == max_player:
-                if sim_score['score'] > best['score']:
-                    best = sim_score
-                    alpha = max(alpha, best['score'])
-                    if beta <= alpha:
-                        break
-            else:
-                if sim_score['score'] < best['score']:
-                    best = sim_score
-                    beta = min(beta, best['score'])
-                    if beta <= alpha:
-                        break
-        return best
+    def _lookup_stats(self, source, start):
+        """Stats of a move that was not searched by the engine"""
+        if start is not None:
+            self.last_stats = SearchStats(source)
+            self.last_stats.time = time.perf_counter() - start
 
 
 class HumanPlayer(Player):
@@ -152,9 +140,44 @@ class HumanPlayer(Player):
         return val
 
 
+class MCTSPlayer(Player):
+    """
+    Monte Carlo Tree Search player, a thin wrapper around mcts.MonteCarloTreeSearch.
+    It runs `iterations` iterations per move, or searches for time_limit_ms, and keeps its tree between moves.
+    Playouts win and block on the spot and play randomly otherwise (TicTacToe.playout).
+    """
+
+    def __init__(self, letter, iterations=None, time_limit_ms=None, rollouts=1, exploration=EXPLORATION, seed=None):
+        """
+        :param iterations: iterations per move, DEFAULT_ITERATIONS if neither budget is given
+        :param time_limit_ms: time budget per move; with both budgets the first one reached ends the search
+        :param rollouts: playouts per new node of the tree
+        """
+        super().__init__(letter)
+        if iterations is None and time_limit_ms is None:
+            iterations = DEFAULT_ITERATIONS
+        self.engine = MonteCarloTreeSearch(iterations, time_limit_ms, rollouts, exploration, seed)
+
+    @property
+    def nodes(self):
+        """iterations of the last move"""
+        return self.engine.nodes
+
+    def get_move(self, game):
+        if len(game.available_moves()) == 0:
+            return None
+        return self.engine.search(game, self.letter)
+
+
 class QLearningPlayer(Player):
+    """
+    Tabular Q-learning player.
+    With symmetry, the 8 rotations and reflections of a board share one Q-table entry:
+    states are mapped to their canonical representative and actions are mapped along with them.
+    """
+
     def __init__(self, letter, q_table=None, training_mode=False, alpha=0.9, alpha_decay=0.999, alpha_min=0.1,
-                 gamma=0.8, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01, debug=False):
+                 gamma=0.8, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01, debug=False, symmetry=True):
         super().__init__(letter)
         self.alpha = alpha
         self.alpha_decay = alpha_decay
@@ -168,18 +191,37 @@ class QLearningPlayer(Player):
         self.delta = 0
         self.training_mode = training_mode
         self.debug = debug
+        self.symmetry = symmetry
 
     def save_q_table(self, filename):
-        with open(filename, 'w') as f:
-            for key, value in self.q_table.items():
-                f.write(f'({key[0]}, {key[1]}):{value}\n')
+        save_binary_q_table(self.q_table, filename, flags=FLAG_CANONICAL if self.symmetry else 0)
         print(f'Saved {len(self.q_table)} Q-values to {filename}')
 
     def load_q_table(self, filename):
+        """
+        Load a binary Q-table, or a text Q-table written by older versions.
+        Outside training mode a binary table is memory-mapped read-only instead of being loaded into a dict.
+        The player uses symmetry if and only if the table was saved with it.
+        """
+        if is_binary_q_table(filename):
+            self.symmetry = bool(read_flags(filename) & FLAG_CANONICAL)
+            if self.training_mode:
+                self.q_table.update(load_binary_q_table(filename))
+            else:
+                self.q_table = MappedQTable(filename)
+            return
+        # text tables have one "(state, action):value" line per entry and were saved without symmetry
+        self.symmetry = False
         with open(filename, 'r') as f:
             for line in f:
                 key, value = line.split(':')
-                key = ((key[3], key[8], key[13], key[18], key[23], key[28], key[33], key[38], key[43]), int(key[-2]))
+                if key.startswith('(('):
+                    # old tables are keyed by the 9-tuple of the board, e.g. (('X', ' ', ...), 4)
+                    board = (key[3], key[8], key[13], key[18], key[23], key[28], key[33], key[38], key[43])
+                    key = (board_to_state_id(board), int(key[-2]))
+                else:
+                    state, action = key[1:-1].split(', ')
+                    key = (int(state), int(action))
                 self.q_table[key] = float(value)
 
     def get_move(self, game):
@@ -195,23 +237,36 @@ class QLearningPlayer(Player):
                 print("Best move")
             move = self.choose_best_move(state, available_moves)
 
-        self.state_history.append((self.get_state(game), move))
+        self.state_history.append(self.q_key(state, move))
 
         # Decrement epsilon
         self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
         return move
 
     def get_state(self, game):
-        return tuple(game.board)
+        return game.state_id
+
+    def canonical(self, state):
+        """
+        :return: (the state used as Q-table key, a tuple mapping each square of `state` to the Q-table's square)
+        """
+        if not self.symmetry:
+            return state, SYMMETRIES[0]
+        return canonical_state(state)
+
+    def q_key(self, state, action):
+        q_state, actions = self.canonical(state)
+        return q_state, actions[action]
 
     def choose_best_move(self, state, available_moves):
+        q_state, actions = self.canonical(state)
         if self.debug:
-            values = {move: self.q_table.get((state, move), 0) for move in available_moves}
+            values = {move: self.q_table.get((q_state, actions[move]), 0) for move in available_moves}
             print(values)
         best_value = -float('inf')
         best_move = random.choice(available_moves)
         for move in available_moves:
-            value = self.q_table.get((state, move), 0)
+            value = self.q_table.get((q_state, actions[move]), 0)
             if value > best_value:
                 best_value = value
                 best_move = move
@@ -219,16 +274,16 @@ class QLearningPlayer(Player):
 
     def update_q_values(self, reward):
         self.delta = 0
+        # the history holds Q-table keys, so the states here are already canonical
         for state, action in reversed(self.state_history):
             self.alpha = max(self.alpha * self.alpha_decay, self.alpha_min)
             old_q_value = self.q_table.get((state, action), 0)
             future_rewards = []
             for next_move in range(9):
-                future_state = list(state)
-                if future_state[next_move] == ' ':
-                    future_state[next_move] = self.letter
-                    future_state = tuple(future_state)
-                    future_rewards.append(self.q_table.get((future_state, next_move), 0))
+                # the square is empty if its base-3 digit is 0
+                if state // POWERS_OF_3[next_move] % 3 == 0:
+                    future_state = state + LETTER_DIGITS[self.letter] * POWERS_OF_3[next_move]
+                    future_rewards.append(self.q_table.get(self.q_key(future_state, next_move), 0))
             max_future_reward = max(future_rewards) if future_rewards else 0
             new_q_value = old_q_value + self.alpha * (reward + self.gamma * max_future_reward - old_q_value)
             self.delta += abs(new_q_value - old_q_value)
@@ -0,0 +1,93 @@
+"""
+This file is for solving Tic-Tac-Toe once and storing perfect play on disk
+
+The table has one (move, score) pair of signed bytes for every base-3 state id (3^9 entries, ~39KB).
+The score is from the point of view of the player to move and uses the same scale as MiniMaxPlayer:
+a win is worth (number of empty squares after the winning move + 1), a draw is worth 0.
+The move is the first square (in ascending order) that reaches the best score, which is also the move
+MiniMaxPlayer's search picks. Terminal and unreachable positions have move NO_MOVE.
+
+Run `python -m tictactoe.solver` from the project root to build the table.
+"""
+from array import array
+
+from consts import TTT_SOLVED_TABLE_PATH
+from .game import TicTacToe
+
+MAGIC = b'TTTS'
+VERSION = 1
+NUM_STATES = 3 ** 9
+NO_MOVE = -1
+
+
+def solve():
+    """
+    Retrograde analysis of every reachable position
+    1. enumerate the reachable positions ply by ply from the empty board
+    2. score them from the last ply back to the first, so that every child is solved before its parent
+    :return: (moves, scores), two arrays indexed by state id
+    """
+    moves = array('b', [NO_MOVE]) * NUM_STATES
+    scores = array('b', [0]) * NUM_STATES
+
+    # plies[n] holds the non-terminal positions with n squares taken
+    plies = [{0: TicTacToe()}]
+    for ply in range(9):
+        letter = 'X' if ply % 2 == 0 else 'O'
+        next_ply = {}
+        for game in plies[ply].values():
+            for square in game.available_moves():
+                child = game.copy()
+                child.make_move(square, letter)
+                if not child.game_over():
+                    next_ply[child.state_id] = child
+        plies.append(next_ply)
+
+    for ply in range(8, -1, -1):
+        letter = 'X' if ply % 2 == 0 else 'O'
+        for state_id, game in plies[ply].items():
+            best_move, best_score = NO_MOVE, None
+            for square in game.available_moves():
+                game.make_move(square, letter)
+                if game.current_winner == letter:
+                    score = game.num_empty_squares() + 1
+                elif not game.empty_squares():
+                    score = 0
+                else:
+                    # the child's score is from the opponent's point of view
+                    score = -scores[game.state_id]
+                game.undo_move(square)
+                if best_score is None or score > best_score:
+                    best_move, best_score = square, score
+            moves[state_id] = best_move
+            scores[state_id] = best_score
+    return moves, scores
+
+
+def save_solved_table(moves, scores, filename=TTT_SOLVED_TABLE_PATH):
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(bytes([VERSION]))
+        moves.tofile(f)
+        scores.tofile(f)
+
+
+def load_solved_table(filename=TTT_SOLVED_TABLE_PATH):
+    """
+    :return: (moves, scores) arrays indexed by state id
+    :raise FileNotFoundError: if the table has not been built
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC or f.read(1) != bytes([VERSION]):
+            raise ValueError(f"{filename} is not a Tic-Tac-Toe solved table")
+        moves = array('b')
+        moves.fromfile(f, NUM_STATES)
+        scores = array('b')
+        scores.fromfile(f, NUM_STATES)
+    return moves, scores
+
+
+if __name__ == '__main__':
+    solved_moves, solved_scores = solve()
+    save_solved_table(solved_moves, solved_scores)
+    print(f"Solved {sum(move != NO_MOVE for move in solved_moves)} positions, saved to {TTT_SOLVED_TABLE_PATH}")
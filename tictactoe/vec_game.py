@@ -0,0 +1,118 @@
+"""
+This file is for playing many Tic-Tac-Toe games in lockstep with NumPy (see vec_env.py)
+
+The games are stored like TicTacToe, as 9-bit masks and the base-3 state id, which is updated on every move.
+With only 3^9 state ids, Q-tables are looked up in a dense array.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from vec_env import NO_WINNER, X, random_legal_moves
+from .game import POWERS_OF_3, WIN_LINES, canonical_state
+
+NUM_STATES = 3 ** 9
+_WIN_LINES = np.array(WIN_LINES, dtype=np.int16)
+_SQUARES = np.arange(9, dtype=np.int16)
+_SQUARE_BITS = np.array([1 << square for square in range(9)], dtype=np.int16)
+_POWERS_OF_3 = np.array(POWERS_OF_3, dtype=np.int32)
+
+
+@lru_cache(maxsize=None)
+def canonical_arrays():
+    """
+    canonical_state of every state id
+    :return: ((3^9,) array of canonical ids, (3^9, 9) array of square maps)
+    """
+    ids = np.zeros(NUM_STATES, dtype=np.int32)
+    maps = np.zeros((NUM_STATES, 9), dtype=np.intp)
+    for state_id in range(NUM_STATES):
+        ids[state_id], maps[state_id] = canonical_state(state_id)
+    return ids, maps
+
+
+class VecTicTacToe:
+    """
+    K Tic-Tac-Toe games played in lockstep. Finished games are reset by step().
+    x_masks holds the 'X' squares of every game and occupied holds all taken squares.
+    """
+
+    num_actions = 9
+
+    def __init__(self, num_games, seed=None):
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+        self.x_masks = np.zeros(num_games, dtype=np.int16)
+        self.occupied = np.zeros(num_games, dtype=np.int16)
+        self.state_ids = np.zeros(num_games, dtype=np.int32)
+        self.num_moves = np.zeros(num_games, dtype=np.int8)
+        self.turns = np.full(num_games, X, dtype=np.int8)
+
+    def reset(self):
+        self._reset_games(slice(None))
+
+    def _reset_games(self, done):
+        self.x_masks[done] = 0
+        self.occupied[done] = 0
+        self.state_ids[done] = 0
+        self.num_moves[done] = 0
+        self.turns[done] = X
+
+    def legal_moves(self):
+        """(K, 9) bool array of the empty squares"""
+        return (self.occupied[:, None] >> _SQUARES) & 1 == 0
+
+    def random_moves(self):
+        return random_legal_moves(self.legal_moves(), self.rng)
+
+    def step(self, actions, active=None):
+        """
+        Put the letter to move on square actions[i] in every game i
+        :param actions: one square per game
+        :param active: bool array of the games to play; the other games are left as they are
+        :return: (winners, done): the winner of every game (NO_WINNER, X or O) and whether it ended with this
+                 move; finished games have been reset when this returns
+        :raise ValueError: if a square is taken or out of range
+        """
+        games = slice(None) if active is None else np.flatnonzero(active)
+        squares = np.asarray(actions)[games]
+        if np.any((squares < 0) | (squares >= 9)):
+            raise ValueError("Invalid move: the square is out of range")
+        bits = _SQUARE_BITS[squares]
+        occupied = self.occupied[games]
+        if np.any(occupied & bits):
+            raise ValueError("Invalid move: the square is taken")
+        turns = self.turns[games]
+        x_moves = turns == X
+        occupied |= bits
+        x_masks = self.x_masks[games] | np.where(x_moves, bits, 0).astype(np.int16)
+        self.occupied[games] = occupied
+        self.x_masks[games] = x_masks
+        self.state_ids[games] += turns * _POWERS_OF_3[squares]
+        num_moves = self.num_moves[games] + 1
+        self.num_moves[games] = num_moves
+        # only the mover's squares can have made a line
+        mover_masks = np.where(x_moves, x_masks, occupied ^ x_masks)
+        won = (mover_masks[:, None] & _WIN_LINES == _WIN_LINES).any(axis=1)
+        winners = np.full(self.num_games, NO_WINNER, dtype=np.int8)
+        winners[games] = np.where(won, turns, NO_WINNER)
+        done = np.zeros(self.num_games, dtype=bool)
+        done[games] = won | (num_moves == 9)
+        self.turns[games] = 3 - turns
+        self._reset_games(done)
+        return winners, done
+
+    @staticmethod
+    def q_lookup(q_table, symmetry):
+        """
+        A snapshot of a QLearningPlayer's Q-table for EpsilonGreedyPolicy
+        :return: fn(state ids) -> (K, 9) array of Q-values, 0 for missing entries
+        """
+        dense = np.zeros((NUM_STATES, 9))
+        for (state, action), value in q_table.items():
+            dense[state, action] = value
+
+        if not symmetry:
+            return lambda state_ids: dense[state_ids]
+        canonical_ids, square_maps = canonical_arrays()
+        return lambda state_ids: dense[canonical_ids[state_ids][:, None], square_maps[state_ids]]
@@ -0,0 +1,147 @@
+"""
+This file is for running tournaments between players of the same game
+
+Every pair of players plays `games_per_pairing` games with each player moving first, optionally on a
+process pool. The result has one entry per player name (not per class, so two players of the same class
+are kept apart) with:
+    games, wins, draws, losses
+    moves, mean/p50/p95/p99 move latency in milliseconds
+    nodes: total nodes searched, for players that count them in a `nodes` attribute (reset every move)
+    opponents: wins/draws/losses against each other player
+Players are created once per match, and those with a close() method, like a MiniMax player with a process
+pool, are closed when it ends.
+Results can be written to JSON or CSV to compare versions.
+"""
+import csv
+import itertools
+import json
+import random
+import time
+from multiprocessing import Pool
+
+CSV_FIELDS = ['name', 'games', 'wins', 'draws', 'losses', 'win_rate', 'moves', 'mean_ms', 'p50_ms', 'p95_ms',
+              'p99_ms', 'nodes']
+
+
+def play_game(game, x_player, o_player):
+    """
+    Play one game to the end
+    :return: (winning letter or None for a tie, {letter: [move latency in seconds]}, {letter: nodes searched})
+    """
+    x_player.letter = 'X'
+    o_player.letter = 'O'
+    latencies = {'X': [], 'O': []}
+    nodes = {'X': 0, 'O': 0}
+    letter = 'X'
+    while not game.game_over():
+        player = x_player if letter == 'X' else o_player
+        start = time.perf_counter()
+        move = player.get_move(game)
+        latencies[letter].append(time.perf_counter() - start)
+        nodes[letter] += getattr(player, 'nodes', 0)
+        if not game.make_move(move, letter):
+            raise ValueError(f"{player.__class__.__name__} played the invalid move {move}")
+        letter = 'O' if letter == 'X' else 'X'
+    return game.current_winner, latencies, nodes
+
+
+def _play_match(task):
+    """Play n games between two players with fixed colors, in a worker or in the current process"""
+    game_factory, x_name, x_factory, o_name, o_factory, n, seed = task
+    random.seed(seed)
+    x_player = x_factory()
+    o_player = o_factory()
+    results = []
+    try:
+        for _ in range(n):
+            winner, latencies, nodes = play_game(game_factory(), x_player, o_player)
+            results.append((winner, latencies, nodes))
+    finally:
+        close_players(x_player, o_player)
+    return x_name, o_name, results
+
+
+def close_players(*players):
+    """Release what the players hold, e.g. the process pool of a parallel MiniMax player"""
+    for player in players:
+        close = getattr(player, 'close', None)
+        if close is not None:
+            close()
+
+
+def _new_stats():
+    return {'games': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'latencies': [], 'nodes': 0, 'opponents': {}}
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank percentile
+    index = max(0, min(len(sorted_values) - 1, -(-percent * len(sorted_values) // 100) - 1))
+    return sorted_values[index]
+
+
+def _summarize(stats):
+    latencies = sorted(stats.pop('latencies'))
+    stats['moves'] = len(latencies)
+    stats['win_rate'] = stats['wins'] / stats['games'] if stats['games'] else 0.0
+    stats['mean_ms'] = 1000 * sum(latencies) / len(latencies) if latencies else 0.0
+    for percent in (50, 95, 99):
+        stats[f'p{percent}_ms'] = 1000 * _percentile(latencies, percent)
+    return stats
+
+
+def run_tournament(game_factory, player_factories, games_per_pairing=100, workers=None, seed=0):
+    """
+    Play every pair of players against each other with both colors
+    :param game_factory: creates an empty game, e.g. the game class
+    :param player_factories: {name: callable returning a new player}; factories must be picklable with workers
+    :param games_per_pairing: number of games per pairing and color
+    :param workers: number of worker processes; the games are played in this process if None or 1
+    :param seed: seed of `random` for every match, so runs can be repeated
+    :return: {name: stats}
+    """
+    tasks = []
+    for first, second in itertools.combinations(player_factories, 2):
+        for x_name, o_name in ((first, second), (second, first)):
+            tasks.append((game_factory, x_name, player_factories[x_name], o_name, player_factories[o_name],
+                          games_per_pairing, f"{seed}:{x_name}:{o_name}"))
+    if workers and workers > 1:
+        with Pool(workers) as pool:
+            matches = pool.map(_play_match, tasks)
+    else:
+        matches = [_play_match(task) for task in tasks]
+
+    stats = {name: _new_stats() for name in player_factories}
+    for x_name, o_name, results in matches:
+        for winner, latencies, nodes in results:
+            for letter, name, opponent in (('X', x_name, o_name), ('O', o_name, x_name)):
+                player_stats = stats[name]
+                record = player_stats['opponents'].setdefault(opponent, {'wins': 0, 'draws': 0, 'losses': 0})
+                outcome = 'draws' if winner is None else 'wins' if winner == letter else 'losses'
+                player_stats[outcome] += 1
+                record[outcome] += 1
+                player_stats['games'] += 1
+                player_stats['latencies'].extend(latencies[letter])
+                player_stats['nodes'] += nodes[letter]
+    return {name: _summarize(player_stats) for name, player_stats in stats.items()}
+
+
+def print_results(results):
+    for name, stats in results.items():
+        print(f"{name}: {stats['wins']}W {stats['draws']}D {stats['losses']}L in {stats['games']} games, "
+              f"{stats['mean_ms']:.3f}ms mean / {stats['p50_ms']:.3f} p50 / {stats['p95_ms']:.3f} p95 / "
+              f"{stats['p99_ms']:.3f} p99 per move, {stats['nodes']} nodes")
+
+
+def save_results(results, filename):
+    """Write the results as CSV if the filename ends with .csv, otherwise as JSON"""
+    if filename.endswith('.csv'):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for name, stats in results.items():
+                writer.writerow({'name': name, **stats})
+    else:
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2)
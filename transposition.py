@@ -0,0 +1,78 @@
+"""
+This file is for the transposition table shared by the search players
+A TTEntry Class
+A TranspositionTable Class
+"""
+from collections import namedtuple
+
+# Bound types of a stored score
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high: the true score is >= score
+UPPER_BOUND = 2  # the search failed low: the true score is <= score
+
+# Replacement policies
+REPLACE_ALWAYS = "always"
+REPLACE_DEPTH = "depth"
+
+TTEntry = namedtuple('TTEntry', ['key', 'depth', 'flag', 'score', 'move', 'age'])
+
+
+def _replace_always(old, depth, age):
+    return True
+
+
+def _replace_depth(old, depth, age):
+    # keep the deeper result, but never let entries from earlier searches block the slot
+    return old.age != age or depth >= old.depth
+
+
+REPLACEMENT_POLICIES = {
+    REPLACE_ALWAYS: _replace_always,
+    REPLACE_DEPTH: _replace_depth,
+}
+
+
+class TranspositionTable:
+    """
+    A fixed-size hash table of search results indexed by a 64-bit position hash (e.g. Zobrist).
+    Every position maps to one slot; on a collision the replacement policy decides which entry to keep.
+    The policy is either the name of a built-in policy or a callable (old_entry, new_depth, age) -> bool.
+    """
+
+    def __init__(self, size=1 << 20, replacement=REPLACE_DEPTH):
+        if size <= 0:
+            raise ValueError("Transposition table size must be positive")
+        self.size = size
+        self.replacement = replacement
+        self.should_replace = REPLACEMENT_POLICIES[replacement] if isinstance(replacement, str) else replacement
+        self.entries = [None] * size
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+
+    def new_search(self):
+        """Mark the start of a new search so that stale entries can be replaced"""
+        self.age += 1
+
+    def probe(self, key):
+        entry = self.entries[key % self.size]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key % self.size
+        old = self.entries[index]
+        if old is None or self.should_replace(old, depth, self.age):
+            self.entries[index] = TTEntry(key, depth, flag, score, move, self.age)
+
+    def __len__(self):
+        return sum(entry is not None for entry in self.entries)
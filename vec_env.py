@@ -0,0 +1,143 @@
+"""
+This file is for playing many games in lockstep with NumPy
+
+A vectorized game (connect4.vec_game.VecConnect4, tictactoe.vec_game.VecTicTacToe) holds K games in arrays.
+Its step() applies one action per game, and it resets every finished game right away, so that all K
+slots are always in use.
+Letters are stored as numbers: NO_WINNER (0) for nobody, X (1) and O (2).
+After a reset, a slot is in a different move of its game than the other slots, so each slot has its own
+letter to move in `turns`.
+
+A batch policy is anything with a get_moves(vec_game) method that returns one action per game:
+RandomComputerPlayer from either game, or EpsilonGreedyPolicy for a Q-table.
+
+NumPy is only needed for this module and the vec_game modules.
+"""
+import numpy as np
+
+NO_WINNER = 0
+X = 1
+O = 2
+LETTERS = {NO_WINNER: None, X: 'X', O: 'O'}
+# the rewards of play_training_episode in the main modules
+WIN_REWARD = 1
+TIE_REWARD = 0.1
+LOSS_REWARD = -1
+
+
+def random_legal_moves(legal, rng):
+    """
+    One uniformly random legal action per row
+    :param legal: (K, number of actions) bool array
+    :param rng: a numpy Generator
+    """
+    # draw any action and draw again for the rows where it is illegal; every row needs a legal action
+    rows = np.arange(len(legal))
+    moves = rng.integers(0, legal.shape[1], size=len(legal))
+    retry = np.flatnonzero(~legal[rows, moves])
+    while len(retry):
+        moves[retry] = rng.integers(0, legal.shape[1], size=len(retry))
+        retry = retry[~legal[retry, moves[retry]]]
+    return moves
+
+
+class EpsilonGreedyPolicy:
+    """
+    Epsilon-greedy moves from a QLearningPlayer's Q-table for every game of a vectorized game.
+    The Q-values are copied into arrays when the policy is created, so call refresh() after the table has
+    been updated. Ties go to the first action, as in QLearningPlayer.choose_best_move.
+    """
+
+    def __init__(self, vec_game, q_player, epsilon=None):
+        """
+        :param epsilon: the chance of a random move; q_player.epsilon in training mode and 0 otherwise if None
+        """
+        self.q_player = q_player
+        if epsilon is None:
+            epsilon = q_player.epsilon if q_player.training_mode else 0.0
+        self.epsilon = epsilon
+        self.q_values = vec_game.q_lookup(q_player.q_table, q_player.symmetry)
+
+    def refresh(self, vec_game):
+        self.q_values = vec_game.q_lookup(self.q_player.q_table, self.q_player.symmetry)
+
+    def get_moves(self, vec_game):
+        legal = vec_game.legal_moves()
+        values = np.where(legal, self.q_values(vec_game.state_ids), -np.inf)
+        moves = values.argmax(axis=1)
+        if self.epsilon > 0:
+            explore = vec_game.rng.random(len(moves)) < self.epsilon
+            moves = np.where(explore, random_legal_moves(legal, vec_game.rng), moves)
+        return moves
+
+
+def play_games(vec_game, x_player, o_player, num_games, record=False):
+    """
+    Play num_games games on all slots of a vectorized game
+    :param x_player: batch policy of 'X'
+    :param o_player: batch policy of 'O'
+    :param record: also return the moves of every game
+    :return: {'X': wins, 'O': wins, 'tie': ties}, and with record a list of (moves, winner) per game,
+             where moves is the list of (state id, action) pairs of the game ('X' first) and winner is a
+             letter or None
+    """
+    vec_game.reset()
+    num_slots = vec_game.num_games
+    # slot i plays game number game_numbers[i]; slots stop once every game number has been handed out
+    game_numbers = np.arange(num_slots)
+    next_game = num_slots
+    results = {'X': 0, 'O': 0, 'tie': 0}
+    history = []
+    winners_by_game = {}
+    finished = 0
+    while finished < num_games:
+        active = game_numbers < num_games
+        if x_player is o_player:
+            actions = x_player.get_moves(vec_game)
+        else:
+            actions = np.where(vec_game.turns == X, x_player.get_moves(vec_game), o_player.get_moves(vec_game))
+        if record:
+            history.append((game_numbers[active], vec_game.state_ids[active], actions[active]))
+        winners, done = vec_game.step(actions, None if active.all() else active)
+        done_winners = winners[done]
+        results['X'] += int(np.count_nonzero(done_winners == X))
+        results['O'] += int(np.count_nonzero(done_winners == O))
+        results['tie'] += int(np.count_nonzero(done_winners == NO_WINNER))
+        finished += len(done_winners)
+        if record:
+            winners_by_game.update(zip(game_numbers[done].tolist(), done_winners.tolist()))
+        # the finished slots were reset by step() and start the next game numbers
+        num_done = len(done_winners)
+        game_numbers[done] = np.arange(next_game, next_game + num_done)
+        next_game += num_done
+    if not record:
+        return results
+    numbers = np.concatenate([numbers for numbers, _, _ in history])
+    state_ids = np.concatenate([state_ids for _, state_ids, _ in history]).tolist()
+    actions = np.concatenate([actions for _, _, actions in history]).tolist()
+    # a stable sort keeps the moves of each game in the order they were played
+    order = np.argsort(numbers, kind='stable')
+    boundaries = np.searchsorted(numbers[order], np.arange(num_games + 1))
+    order = order.tolist()
+    episodes = []
+    for game_number in range(num_games):
+        game_moves = [(state_ids[i], actions[i]) for i in order[boundaries[game_number]:boundaries[game_number + 1]]]
+        episodes.append((game_moves, LETTERS[winners_by_game[game_number]]))
+    return results, episodes
+
+
+def learn_from_episodes(q_player, opponent, episodes):
+    """
+    Update two QLearningPlayers sharing a Q-table from recorded games, with the rewards of
+    play_training_episode: each player learns from the moves of its own letter
+    :param episodes: the recorded games of play_games
+    """
+    for game_moves, winner in episodes:
+        if winner is None:
+            reward = TIE_REWARD
+        else:
+            reward = WIN_REWARD if winner == q_player.letter else LOSS_REWARD
+        for player, player_reward in ((q_player, reward), (opponent, -reward)):
+            first = 0 if player.letter == 'X' else 1
+            player.state_history = [player.q_key(state, action) for state, action in game_moves[first::2]]
+            player.update_q_values(player_reward)